@@ -0,0 +1,491 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from embedding_cache import normalize_query, text_hash
+from ingest_manifest import content_key
+
+
+def normalize_vector(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerIndex:
+    """Query vectors of one collection's cached answers.
+
+    Vectors are normalized once on insert and kept in one contiguous float32
+    matrix, so a lookup is a single matrix-vector product followed by argmax
+    instead of a scan that decodes and re-normalizes every entry. That
+    product still reads every row, so lookup time grows linearly with the
+    entry count (see resources.answer_cache_max_entries). The matrix stays
+    float32: NumPy has no BLAS path for float16 and multiplies it far slower.
+    Rows are removed by moving the last row into the hole, keeping the
+    matrix dense.
+
+    Each row also records the collection generation it was cached at and
+    the content keys (ingest_manifest.content_key) of the chunks the answer
+    was built from (`deps`).
+    """
+
+    def __init__(self, dim, capacity=1024):
+        self.dim = dim
+        self.count = 0
+        self.keys = []             # row -> normalized query
+        self.rows = {}             # normalized query -> row
+        self.deps = []             # row -> tuple of content keys
+        self.matrix = self._resize_matrix(capacity)
+        self.created = np.zeros(self.matrix.shape[0], dtype=np.float64)
+        self.last_used = np.zeros(self.matrix.shape[0], dtype=np.float64)
+        self.generations = np.zeros(self.matrix.shape[0], dtype=np.int64)
+
+    def _resize_matrix(self, capacity):
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        if self.count:
+            matrix[:self.count] = self.matrix[:self.count]
+        return matrix
+
+    def _grow(self, needed):
+        capacity = self.matrix.shape[0]
+        while capacity < needed:
+            capacity *= 2
+        self.matrix = self._resize_matrix(capacity)
+        for name in ("created", "last_used", "generations"):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def restore(self, keys, created, last_used, generations, deps):
+        """Adopt rows 0..len(keys)-1 whose vectors are already in the matrix."""
+        if len(keys) > self.matrix.shape[0]:
+            self._grow(len(keys))
+        self.keys = list(keys)
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.deps = [tuple(d) for d in deps]
+        self.count = len(self.keys)
+        self.created[:self.count] = created
+        self.last_used[:self.count] = last_used
+        self.generations[:self.count] = generations
+
+    def add(self, key, vector, now, generation=0, deps=()):
+        row = self.rows.get(key)
+        if row is None:
+            if self.count == self.matrix.shape[0]:
+                self._grow(self.count + 1)
+            row = self.count
+            self.count += 1
+            self.keys.append(key)
+            self.deps.append(())
+            self.rows[key] = row
+        self.matrix[row] = vector
+        self.created[row] = now
+        self.last_used[row] = now
+        self.generations[row] = generation
+        self.deps[row] = tuple(deps)
+        return row
+
+    def remove(self, row):
+        """Drop `row`; returns the key moved into it, or None."""
+        last = self.count - 1
+        del self.rows[self.keys[row]]
+        moved = None
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.created[row] = self.created[last]
+            self.last_used[row] = self.last_used[last]
+            self.generations[row] = self.generations[last]
+            self.deps[row] = self.deps[last]
+            moved = self.keys[row] = self.keys[last]
+            self.rows[moved] = row
+        self.keys.pop()
+        self.deps.pop()
+        self.count = last
+        return moved
+
+    def best(self, vector, not_before):
+        """Return (row, score) of the most similar live entry, or (None, -1)."""
+        if not self.count:
+            return None, -1.0
+        scores = self.matrix[:self.count] @ vector
+        scores[self.created[:self.count] < not_before] = -np.inf
+        row = int(np.argmax(scores))
+        return (row, float(scores[row])) if np.isfinite(scores[row]) else (None, -1.0)
+
+
+class MmapAnswerIndex(AnswerIndex):
+    """AnswerIndex whose matrix lives in a raw float32 file mapped with np.memmap,
+    so a restart maps the vectors back instead of reloading them row by row."""
+
+    def __init__(self, path, dim, capacity=1024):
+        self.path = path
+        existing = os.path.getsize(path) // (dim * 4) if os.path.exists(path) else 0
+        super().__init__(dim, max(capacity, existing))
+
+    def _resize_matrix(self, capacity):
+        if self.count:
+            self.matrix.flush()
+        with open(self.path, "ab") as f:
+            if f.tell() < capacity * self.dim * 4:
+                f.truncate(capacity * self.dim * 4)
+        return np.memmap(self.path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+
+class AnswerCache:
+    """Answers to earlier questions, found again by query-embedding similarity.
+
+    Entries are scoped per collection, a lookup returns the best match above
+    `threshold` rather than the first one, entries expire after
+    `ttl_seconds`, and each collection keeps at most `max_entries` answers,
+    dropping the least recently used first. Ingestion does not flush the
+    cache: invalidate() drops only the answers whose source PDFs changed.
+
+    Similarity search always runs on an in-process AnswerIndex; backends
+    decide where the index and the answers themselves are kept by
+    implementing the _open_index/_load_entry/_save_entry/_delete_entry/
+    _clear hooks.
+    """
+
+    def __init__(self, threshold=0.92, ttl_seconds=24 * 3600, max_entries=20_000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.indexes = {}
+        self.synced_generations = {}
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    def lookup(self, collection_name, query_embedding, threshold=None):
+        """Return the cached entry most similar to the query, or None.
+
+        The entry is a dict with "query", "response", "sources" and "score".
+        """
+        threshold = self.threshold if threshold is None else threshold
+        vector = normalize_vector(query_embedding)
+        now = time.time()
+        with self.lock:
+            index = self._open_index(collection_name)
+            row, score = (None, -1.0)
+            if index is not None and index.dim == vector.shape[0]:
+                row, score = index.best(vector, now - self.ttl_seconds)
+            entry = None
+            if row is not None and score >= threshold:
+                entry = self._load_entry(collection_name, index.keys[row])
+                if entry is None:
+                    # dropped behind our back (another process, or Redis expiry)
+                    self._drop(collection_name, index, row)
+            if entry is None:
+                self.misses += 1
+                return None
+            index.last_used[row] = now
+            self._touch(collection_name, index.keys[row], now)
+            self.hits += 1
+            return dict(entry, score=score)
+
+    def store(self, collection_name, query, response, query_embedding, sources=(), generation=0):
+        """Cache an answer. `sources` describe the chunks it was built from
+        (their "chunk_id" is what it depends on) and `generation` is the
+        collection generation read before retrieval, so a PDF replaced in
+        the meantime still invalidates it."""
+        vector = normalize_vector(query_embedding)
+        key = normalize_query(query)
+        now = time.time()
+        sources = list(sources)
+        deps = sorted({content_key(source["chunk_id"]) for source in sources if source.get("chunk_id")})
+        entry = {"query": query, "response": response, "sources": sources}
+        with self.lock:
+            index = self._open_index(collection_name)
+            if index is not None and index.dim != vector.shape[0]:
+                # the embedding model changed; old vectors are not comparable
+                self.clear(collection_name)
+                index = None
+            if index is None:
+                index = self._open_index(collection_name, dim=vector.shape[0])
+            row = index.add(key, vector, now, generation, deps)
+            self._save_entry(collection_name, key, row, entry, vector, now, generation, deps)
+            if index.count > self.max_entries:
+                self._evict(collection_name, index, now)
+
+    def invalidate(self, collection_name, generation, content_generations):
+        """Drop answers depending on chunks that changed after they were cached.
+
+        `generation` and `content_generations` come from the collection's
+        IngestManifest. Answers that cite no source (e.g. "not in the
+        documents") depend on the whole collection and are dropped on any
+        change. Returns the number of answers dropped.
+        """
+        with self.lock:
+            if self.synced_generations.get(collection_name) == generation:
+                return 0
+            index = self._open_index(collection_name)
+            dropped = 0
+            if index is not None:
+                for row in range(index.count - 1, -1, -1):
+                    made = index.generations[row]
+                    if made >= generation:
+                        continue
+                    deps = index.deps[row]
+                    if not deps or any(content_generations.get(dep, 0) > made for dep in deps):
+                        self._drop(collection_name, index, row)
+                        dropped += 1
+            self.synced_generations[collection_name] = generation
+            self.invalidated += dropped
+            return dropped
+
+    def clear(self, collection_name=None):
+        with self.lock:
+            names = list(self.indexes) if collection_name is None else [collection_name]
+            for name in names:
+                self.indexes.pop(name, None)
+                self.synced_generations.pop(name, None)
+                self._clear(name)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidated": self.invalidated,
+                    "entries": {name: index.count for name, index in self.indexes.items()}}
+
+    def _drop(self, collection_name, index, row):
+        key = index.keys[row]
+        moved = index.remove(row)
+        self._delete_entry(collection_name, key, moved, row)
+
+    def _evict(self, collection_name, index, now):
+        expired = np.nonzero(index.created[:index.count] < now - self.ttl_seconds)[0]
+        for row in sorted(expired, reverse=True):
+            self._drop(collection_name, index, int(row))
+        while index.count > self.max_entries:
+            self._drop(collection_name, index, int(np.argmin(index.last_used[:index.count])))
+
+    # Backend hooks, called with self.lock held.
+
+    def _open_index(self, collection_name, dim=None):
+        """Return the collection's index, creating it when `dim` is given."""
+        raise NotImplementedError
+
+    def _load_entry(self, collection_name, key):
+        raise NotImplementedError
+
+    def _save_entry(self, collection_name, key, row, entry, vector, now, generation, deps):
+        raise NotImplementedError
+
+    def _delete_entry(self, collection_name, key, moved_key, row):
+        raise NotImplementedError
+
+    def _touch(self, collection_name, key, now):
+        pass
+
+    def _clear(self, collection_name):
+        raise NotImplementedError
+
+
+class MemoryAnswerCache(AnswerCache):
+    """Everything in process memory; gone on restart."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.entries = {}
+
+    def _open_index(self, collection_name, dim=None):
+        index = self.indexes.get(collection_name)
+        if index is None and dim is not None:
+            index = self.indexes[collection_name] = AnswerIndex(dim)
+            self.entries[collection_name] = {}
+        return index
+
+    def _load_entry(self, collection_name, key):
+        return self.entries[collection_name].get(key)
+
+    def _save_entry(self, collection_name, key, row, entry, vector, now, generation, deps):
+        self.entries[collection_name][key] = entry
+
+    def _delete_entry(self, collection_name, key, moved_key, row):
+        self.entries[collection_name].pop(key, None)
+
+    def _clear(self, collection_name):
+        self.entries.pop(collection_name, None)
+
+
+class SqliteAnswerCache(AnswerCache):
+    """Embedded backend for single-node deployments: answers in a SQLite file,
+    query vectors in one memory-mapped float32 matrix per collection.
+
+    Each row of the answers table records its row in the matrix, so
+    restarting maps the matrix file and reads the small per-row columns
+    instead of rebuilding anything. Meant for one app process per folder.
+    """
+
+    def __init__(self, folder, **kwargs):
+        super().__init__(**kwargs)
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(folder, "answers.sqlite3"), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS collections (
+                collection TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL)""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                collection TEXT NOT NULL,
+                key TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                query TEXT NOT NULL,
+                response TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                generation INTEGER NOT NULL,
+                deps TEXT NOT NULL,
+                PRIMARY KEY (collection, key))""")
+        self.conn.commit()
+
+    def _matrix_path(self, collection_name):
+        return os.path.join(self.folder, f"{collection_name}.f32")
+
+    def _open_index(self, collection_name, dim=None):
+        index = self.indexes.get(collection_name)
+        if index is not None:
+            return index
+        found = self.conn.execute("SELECT dim FROM collections WHERE collection = ?", (collection_name,)).fetchone()
+        if found is None:
+            if dim is None:
+                return None
+            self.conn.execute("INSERT INTO collections VALUES (?, ?)", (collection_name, dim))
+            self.conn.commit()
+        else:
+            dim = found[0]
+        index = MmapAnswerIndex(self._matrix_path(collection_name), dim)
+        rows = self.conn.execute("SELECT row, key, created, last_used, generation, deps FROM answers "
+                                 "WHERE collection = ? ORDER BY row", (collection_name,)).fetchall()
+        if [r[0] for r in rows] == list(range(len(rows))):
+            index.restore([r[1] for r in rows], [r[2] for r in rows], [r[3] for r in rows],
+                          [r[4] for r in rows], [json.loads(r[5]) for r in rows])
+        else:
+            # interrupted mid-update; it is only a cache, start the collection over
+            self.conn.execute("DELETE FROM answers WHERE collection = ?", (collection_name,))
+            self.conn.commit()
+        self.indexes[collection_name] = index
+        return index
+
+    def _load_entry(self, collection_name, key):
+        found = self.conn.execute("SELECT query, response, sources FROM answers WHERE collection = ? AND key = ?",
+                                  (collection_name, key)).fetchone()
+        if found is None:
+            return None
+        return {"query": found[0], "response": found[1], "sources": json.loads(found[2])}
+
+    def _save_entry(self, collection_name, key, row, entry, vector, now, generation, deps):
+        self.indexes[collection_name].matrix.flush()
+        self.conn.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          (collection_name, key, row, entry["query"], entry["response"],
+                           json.dumps(entry["sources"]), now, now, generation, json.dumps(deps)))
+        self.conn.commit()
+
+    def _delete_entry(self, collection_name, key, moved_key, row):
+        self.conn.execute("DELETE FROM answers WHERE collection = ? AND key = ?", (collection_name, key))
+        if moved_key is not None:
+            self.conn.execute("UPDATE answers SET row = ? WHERE collection = ? AND key = ?",
+                              (row, collection_name, moved_key))
+        self.conn.commit()
+
+    def _touch(self, collection_name, key, now):
+        self.conn.execute("UPDATE answers SET last_used = ? WHERE collection = ? AND key = ?",
+                          (now, collection_name, key))
+        self.conn.commit()
+
+    def _clear(self, collection_name):
+        self.conn.execute("DELETE FROM answers WHERE collection = ?", (collection_name,))
+        self.conn.execute("DELETE FROM collections WHERE collection = ?", (collection_name,))
+        self.conn.commit()
+        if os.path.exists(self._matrix_path(collection_name)):
+            os.remove(self._matrix_path(collection_name))
+
+
+class RedisAnswerCache(AnswerCache):
+    """Answers shared through Redis by every app process.
+
+    Each answer is a hash "answer:<collection>:<key hash>" that Redis
+    expires after the TTL, and "answers:<collection>" is a sorted set of key
+    hashes scored by creation time. Every process keeps its own AnswerIndex
+    and, before a lookup, pulls only the entries added since its last sync,
+    so lookups never scan the keyspace.
+    """
+
+    def __init__(self, client, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+        self.client.ping()
+        self.synced = {}           # collection -> newest creation time seen
+
+    def _entry_key(self, collection_name, key):
+        return f"answer:{collection_name}:{text_hash(key)}"
+
+    def _open_index(self, collection_name, dim=None):
+        index = self.indexes.get(collection_name)
+        since = self.synced.get(collection_name, "-inf")
+        new = self.client.zrangebyscore(f"answers:{collection_name}", since, "+inf", withscores=True)
+        for member, created in new:
+            key, vector, generation, deps = self.client.hmget(f"answer:{collection_name}:{member.decode()}",
+                                                              "key", "vector", "generation", "deps")
+            if key is None:
+                continue
+            key = key.decode()
+            vector = np.frombuffer(vector, dtype=np.float32)
+            if index is None:
+                index = self.indexes[collection_name] = AnswerIndex(vector.shape[0])
+            if vector.shape[0] == index.dim:
+                index.add(key, vector, created, int(generation), json.loads(deps))
+            self.synced[collection_name] = max(created, self.synced.get(collection_name, created))
+        if index is None and dim is not None:
+            index = self.indexes[collection_name] = AnswerIndex(dim)
+        return index
+
+    def _load_entry(self, collection_name, key):
+        found = self.client.hmget(self._entry_key(collection_name, key), "query", "response", "sources")
+        if found[0] is None:
+            return None
+        return {"query": found[0].decode(), "response": found[1].decode(), "sources": json.loads(found[2])}
+
+    def _save_entry(self, collection_name, key, row, entry, vector, now, generation, deps):
+        entry_key = self._entry_key(collection_name, key)
+        pipe = self.client.pipeline()
+        pipe.hset(entry_key, mapping={"key": key, "query": entry["query"], "response": entry["response"],
+                                      "sources": json.dumps(entry["sources"]), "vector": vector.tobytes(),
+                                      "generation": generation, "deps": json.dumps(deps)})
+        pipe.expire(entry_key, int(self.ttl_seconds))
+        pipe.zadd(f"answers:{collection_name}", {text_hash(key): now})
+        pipe.zremrangebyscore(f"answers:{collection_name}", "-inf", now - self.ttl_seconds)
+        pipe.execute()
+
+    def _delete_entry(self, collection_name, key, moved_key, row):
+        pipe = self.client.pipeline()
+        pipe.delete(self._entry_key(collection_name, key))
+        pipe.zrem(f"answers:{collection_name}", text_hash(key))
+        pipe.execute()
+
+    def _clear(self, collection_name):
+        members = self.client.zrange(f"answers:{collection_name}", 0, -1)
+        keys = [f"answer:{collection_name}:{member.decode()}" for member in members]
+        self.client.delete(f"answers:{collection_name}", *keys)
+        self.synced.pop(collection_name, None)
+
+
+def make_answer_cache(backend, path=None, redis_client=None, **kwargs):
+    """Build the answer cache named by `backend`: "memory", "sqlite" (needs
+    `path`, a folder) or "redis" (needs `redis_client`)."""
+    if backend == "memory":
+        return MemoryAnswerCache(**kwargs)
+    if backend == "sqlite":
+        return SqliteAnswerCache(path, **kwargs)
+    if backend == "redis":
+        return RedisAnswerCache(redis_client, **kwargs)
+    raise ValueError(f"Unknown answer cache backend: {backend}")
@@ -1,11 +1,19 @@
+import asyncio
+import html
+import itertools
 import streamlit as st
 import os
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
-from pdf_utils import model_embedding, persist_directory
-from pdf_utils import get_llm, get_conversation_chain, build_prompt
+from pdf_utils import get_conversation_chain, build_prompt, context_budget, not_available_response
+from context_packer import pack_context
+from resources import (answer_scope, get_answer_cache, get_query_embeddings, get_retriever, get_shared_llm,
+                       iter_async, question_flights, scope_generation, sync_answer_cache)
+from embedding_cache import normalize_query
+from llm_scheduler import AdmissionRejected
+import metrics
+from langchain_core.documents import Document
 from Templates.htmlTemplates import css, bot_template, user_template,get_base64_image
 from embedder import log_file, output_folder
+from ingest_manifest import IngestManifest, manifest_path, read_legacy_log
 from PIL import Image
 from io import BytesIO
 from PIL import Image
@@ -21,36 +29,217 @@ user_team_map = {
     "a" : ["Team A", "Team B"]
 }
 
+# Answer questions through the asyncio pipeline (handle_userinput_async)
+# instead of the blocking handle_userinput
+async_pipeline = True
+
+# When the LLM is overloaded, answer from the cache with this looser
+# similarity, or with overload_message. A looser match can be an answer to a
+# different question ("sick" vs "casual" leaves), so it is shown with the
+# question it answered and marked as approximate.
+overload_cache_threshold = 0.80
+overload_message = "Phineas is answering a lot of questions right now. Please try again in a moment."
+
+# Chunks retrieved per question; build_context keeps the most relevant ones
+# that fit the prompt's token budget. Hybrid retrieval ranks well enough
+# that a handful is plenty.
+retrieval_k = 5
+
+# Vector relevance (metadata["score"]) the best retrieved chunk must reach
+# for the question to go to the LLM; below it the question is answered with
+# not_available_response straight away. 0.3 is a cosine similarity of about
+# 0.5 under Chroma's L2 relevance. None sends every question to the LLM.
+relevance_floor = 0.3
+
 # --------------------------------------------
-def handle_userinput(user_question, retriever):
-    relevant_docs = retriever.get_relevant_documents(user_question, k=3)
-    
-    # Process and filter contexts for relevance
-    contexts = []
-    sources = []
-    
-    for doc in relevant_docs:
-        # Extract metadata
-        source = doc.metadata.get('source', 'Unknown source')
-        page = doc.metadata.get('page', 'Unknown page')
-        
-        # Add source info to context
-        context_with_source = f"[From: {os.path.basename(source)}, Page: {page}]\n{doc.page_content}"
-        contexts.append(context_with_source)
-        sources.append(f"{os.path.basename(source)}, Page: {page}")
+def handle_userinput(user_question, retriever, collection_names):
+    # Answer repeated (or near-identical) questions from the semantic cache
+    answer_cache = get_answer_cache()
+    scope = answer_scope(collection_names)
+    generation = sync_answer_cache(collection_names)
+    query_embedding = get_query_embeddings().embed_query(user_question)
+    cached = answer_cache.lookup(scope, query_embedding)
+    if cached:
+        relevant_docs = [Document(page_content="", metadata=meta) for meta in cached["sources"]]
+        show_exchange(user_question, [cached["response"]])
+        return answer_result(relevant_docs)
+
+    relevant_docs = retriever.invoke(user_question, k=retrieval_k, query_vector=query_embedding)
+    if below_relevance_floor(relevant_docs):
+        show_exchange(user_question, [not_available_response])
+        return answer_result([])
     
-    # Join all contexts with clear separators
-    full_context = "\n\n---\n\n".join(contexts)
+    # Most relevant source-tagged contexts that fit the window
+    full_context, relevant_docs = build_context(user_question, relevant_docs)
     
     # Build the prompt using enhanced prompt engineering
     prompt = build_prompt(user_question, full_context)
     
-    # Get LLM instance
-    llm = get_llm()
-    
-    # Send the prompt to LLM
-    response_text = llm.predict(prompt)
+    # Shared LLM client, reused across questions and sessions
+    llm = get_shared_llm()
     
+    # Stream the answer from the LLM as it is generated
+    rejected = []
+
+    def answer_chunks():
+        try:
+            yield from llm.stream(prompt)
+        except AdmissionRejected:
+            rejected.append(True)
+            yield overload_answer(answer_cache, scope, query_embedding)
+
+    response_text = show_exchange(user_question, answer_chunks())
+    if rejected:
+        return answer_result(relevant_docs)
+    answer_cache.store(scope, user_question, response_text, query_embedding,
+                       sources=source_details(relevant_docs), generation=generation)
+
+    return answer_result(relevant_docs)
+
+
+def overload_answer(answer_cache, scope, query_embedding):
+    """Reply for a question the LLM scheduler turned away."""
+    metrics.incr("llm.overload_answers")
+    cached = answer_cache.lookup(scope, query_embedding, threshold=overload_cache_threshold)
+    if not cached:
+        return overload_message
+    return (f"⚠️ Phineas is busy, so here is an earlier answer to a similar question, "
+            f"<i>\"{html.escape(cached['query'])}\"</i>. It may not match your question exactly; "
+            f"please ask again later to be sure.<br><br>{cached['response']}")
+
+
+def source_details(relevant_docs):
+    # what the answer cache keeps of each source document
+    return [{'source': doc.metadata.get('source', 'N/A'), 'page': doc.metadata.get('page', 'N/A'),
+             'collection': doc.metadata.get('collection', 'N/A'), 'chunk_id': doc.id}
+            for doc in relevant_docs]
+
+
+def below_relevance_floor(relevant_docs):
+    """True when no retrieved chunk is relevant enough to be worth an LLM
+    call. Keyword-only hits carry no vector score and do not count; a
+    retriever that reports no scores at all never trips the floor."""
+    if relevance_floor is None:
+        return False
+    scores = [doc.metadata.get("score") for doc in relevant_docs]
+    scores = [score for score in scores if score is not None]
+    if relevant_docs and not scores:
+        return False
+    best = max(scores, default=None)
+    if best is not None and best >= relevance_floor:
+        return False
+    metrics.incr("answers.below_relevance_floor")
+    print(f"No chunk above the relevance floor (best {best}), answering without the LLM")
+    return True
+
+
+def build_context(user_question, relevant_docs):
+    """Pack the retrieved chunks (most relevant first) into the question's
+    token budget; returns the context text and the chunks it contains."""
+    budget = context_budget(user_question)
+    context, packed, tokens = pack_context(relevant_docs, budget)
+    metrics.incr("context.tokens", tokens)
+    metrics.set_gauge("context.last_tokens", tokens)
+    print(f"Context: {len(packed)} of {len(relevant_docs)} chunks, {tokens}/{budget} tokens")
+    return context, packed
+
+
+async def answer_events(user_question, retrievers, collection_names):
+    """Async version of the query path. Yields the source documents first,
+    then the answer text chunk by chunk.
+
+    The question is embedded once, and that vector serves both the cache
+    lookup and every retriever. The generation sync and cache lookup run
+    concurrently with retrieval, which is cancelled when the cache answers.
+    """
+    answer_cache = get_answer_cache()
+    scope = answer_scope(collection_names)
+    embedding = asyncio.ensure_future(get_query_embeddings().aembed_query(user_question))
+
+    async def cached_answer():
+        generation, query_embedding = await asyncio.gather(
+            asyncio.to_thread(sync_answer_cache, collection_names), embedding)
+        return generation, query_embedding, answer_cache.lookup(scope, query_embedding)
+
+    async def retrieve():
+        query_vector = await embedding
+        results = await asyncio.gather(*(retriever.ainvoke(user_question, k=retrieval_k, query_vector=query_vector)
+                                         for retriever in retrievers))
+        # interleave the ranked lists so the result stays in relevance order
+        return [doc for rank in itertools.zip_longest(*results) for doc in rank if doc is not None]
+
+    retrieval = asyncio.ensure_future(retrieve())
+    try:
+        generation, query_embedding, cached = await cached_answer()
+    except BaseException:
+        retrieval.cancel()
+        embedding.cancel()
+        raise
+    if cached:
+        retrieval.cancel()
+        yield [Document(page_content="", metadata=meta) for meta in cached["sources"]]
+        yield cached["response"]
+        return
+
+    relevant_docs = await retrieval
+    if below_relevance_floor(relevant_docs):
+        yield []
+        yield not_available_response
+        return
+
+    full_context, relevant_docs = build_context(user_question, relevant_docs)
+    yield relevant_docs
+
+    prompt = build_prompt(user_question, full_context)
+    response_text = ""
+    try:
+        async for chunk in get_shared_llm().astream(prompt):
+            response_text += chunk
+            yield chunk
+    except AdmissionRejected:
+        yield overload_answer(answer_cache, scope, query_embedding)
+        return
+    answer_cache.store(scope, user_question, response_text, query_embedding,
+                       sources=source_details(relevant_docs), generation=generation)
+
+
+def handle_userinput_async(user_question, retrievers, collection_names):
+    """handle_userinput on the shared event loop: the script thread only
+    renders, while the I/O of every session overlaps on one loop.
+
+    Sessions asking the same question of the same index at the same time
+    are coalesced: one of them runs the pipeline and all of them receive
+    its streamed tokens.
+    """
+    generation, _ = scope_generation(collection_names)
+    key = (answer_scope(collection_names), normalize_query(user_question), generation)
+    events = question_flights.stream(
+        key, lambda: iter_async(answer_events(user_question, retrievers, collection_names)))
+    relevant_docs = next(events)
+    show_exchange(user_question, events)
+    return answer_result(relevant_docs)
+
+
+def show_exchange(user_question, answer_chunks):
+    """Show the recent conversation and the new question, then render the
+    answer in the bot template chunk by chunk as `answer_chunks` yields it.
+    The full answer is added to the chat history once it is complete."""
+    # Earlier messages: with the new pair this shows the last 3 exchanges
+    history = st.session_state.chat_history[-4:]
+    for i in range(len(history)):
+        if i % 2 == 0:
+            st.write(user_template.replace("{{MSG}}", history[i].content), unsafe_allow_html=True)
+        else:
+            st.write(bot_template.replace("{{MSG}}", history[i].content), unsafe_allow_html=True)
+    st.write(user_template.replace("{{MSG}}", user_question), unsafe_allow_html=True)
+
+    placeholder = st.empty()
+    response_text = ""
+    for chunk in answer_chunks:
+        response_text += chunk
+        placeholder.write(bot_template.replace("{{MSG}}", response_text + " ▌"), unsafe_allow_html=True)
+    placeholder.write(bot_template.replace("{{MSG}}", response_text), unsafe_allow_html=True)
+
     # Add current Q&A to history
     st.session_state.chat_history.extend([
         type('Msg', (object,), {'content': user_question}),
@@ -60,19 +249,16 @@ def handle_userinput(user_question, retriever):
     # Keep only the last 6 messages (3 exchanges) for context
     if len(st.session_state.chat_history) > 6:
         st.session_state.chat_history = st.session_state.chat_history[-6:]
-    
-    # Display the most recent conversation
-    for i in range(len(st.session_state.chat_history)):
-        if i % 2 == 0:
-            st.write(user_template.replace("{{MSG}}", st.session_state.chat_history[i].content), unsafe_allow_html=True)
-        else:
-            bot_msg = bot_template.replace("{{MSG}}", st.session_state.chat_history[i].content)
-            st.write(bot_msg, unsafe_allow_html=True)
 
+    return response_text
+
+
+def answer_result(relevant_docs):
     return {
         'chat_history': st.session_state.chat_history,
         'source_documents': relevant_docs,
-        'sources': sources
+        'sources': [f"{os.path.basename(str(doc.metadata.get('source', 'Unknown source')))}, Page: {doc.metadata.get('page', 'Unknown page')}"
+                    for doc in relevant_docs]
     }
 
 # --------------------------------------------
@@ -235,55 +421,66 @@ def main():
 
     user_email = st.session_state.email
     user_team = user_team_map[user_email]
-    available_collections = ["Default", user_team]
-    selected_collection = st.sidebar.selectbox("Choose collection", available_collections)
-    collection_name = selected_collection.replace(" ", "_").lower()
+    user_teams = user_team if isinstance(user_team, list) else [user_team]
+    # Questions search every collection the user can access, unless they
+    # narrow it down here
+    available_collections = ["Default"] + user_teams
+    selected_collections = st.sidebar.multiselect("Search collections", available_collections,
+                                                  default=available_collections)
+    collection_names = [selected.replace(" ", "_").lower() for selected in selected_collections]
 
     # --------------------------------------------
     # SIDEBAR UI
     st.sidebar.header("Welcome")
     st.sidebar.write(f"👤 {user_email}")
-    st.sidebar.write(f"🏷️ Team: {user_team}")
+    st.sidebar.write(f"🏷️ Team: {', '.join(user_teams)}")
     st.sidebar.markdown("---")
 
     st.sidebar.title("📂 Processed PDFs")
-    pdf_list_path = os.path.join(os.curdir, output_folder, f"{collection_name}_{log_file}")
-
-    if os.path.exists(pdf_list_path):
-        with open(pdf_list_path, "r") as file:
-            pdf_files = [pdf.strip() for pdf in file if pdf.strip()]
-    else:
-        pdf_files = []
+    for selected, collection_name in zip(selected_collections, collection_names):
+        st.sidebar.markdown(f"**{selected}**")
+        path = manifest_path(os.path.join(os.curdir, output_folder), collection_name)
+        if os.path.exists(path):
+            pdf_files = IngestManifest(path).sources()
+        else:
+            # Deployments not re-ingested since the manifest replaced the processed log
+            pdf_files = read_legacy_log(os.path.join(os.curdir, output_folder, f"{collection_name}_{log_file}"))
 
-    if pdf_files:
-        for pdf in pdf_files:
-            st.sidebar.markdown(f"✅ {pdf}")
-    else:
-        st.sidebar.markdown("❌ No PDFs processed yet.")
+        if pdf_files:
+            for pdf in pdf_files:
+                st.sidebar.markdown(f"✅ {pdf}")
+        else:
+            st.sidebar.markdown("❌ No PDFs processed yet.")
 
     st.sidebar.markdown("---")
+    with st.sidebar.expander("📈 Metrics"):
+        st.json(metrics.snapshot())
     if st.sidebar.button("Logout"):
         st.session_state.logged_in = False
         st.session_state.email = ""
         st.rerun()
 
     # --------------------------------------------
-    # Vector Store (team-specific)
-    vectorstore = Chroma(
-        collection_name=collection_name,
-        embedding_function=OllamaEmbeddings(model=model_embedding),
-        persist_directory=persist_directory,
-    )
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 1})
+    if not collection_names:
+        st.info("Select at least one collection to search.")
+        st.stop()
+
+    # One retriever searching the selected collections in parallel (hybrid
+    # BM25 + vectors); the collections stay open across reruns and sessions
+    retriever = get_retriever(collection_names)
 
     # --------------------------------------------
     # User Input
     user_question = st.text_input("🔍 Ask a question:")
     if user_question:
-        response = handle_userinput(user_question, retriever)
+        if async_pipeline:
+            response = handle_userinput_async(user_question, [retriever], collection_names)
+        else:
+            response = handle_userinput(user_question, retriever, collection_names)
         with st.expander("📚 Source Details"):
             for i, doc in enumerate(response["source_documents"]):
-                st.markdown(f"📄 **Source:** `{doc.metadata.get('source', 'N/A')}` | 📄 **Page:** `{doc.metadata.get('page', 'N/A')}`")
+                st.markdown(f"🗂️ **Collection:** `{doc.metadata.get('collection', 'N/A')}` | "
+                            f"📄 **Source:** `{doc.metadata.get('source', 'N/A')}` | 📄 **Page:** `{doc.metadata.get('page', 'N/A')}`")
                 st.markdown("---")
 
     # Footer
@@ -0,0 +1,169 @@
+"""Per-stage ingestion benchmark on synthetic policy PDFs.
+
+    python benchmarks/bench_ingest.py --pages 10,100,500 --output bench.json
+
+For every PDF size it times pypdf parsing, RecursiveCharacterTextSplitter,
+embedding through OllamaEmbeddings against a local stub server and the
+Chroma upsert, then runs get_pdf_text_emd end to end in a subprocess. The
+result is one JSON document (stdout or --output) tagged with the current git
+commit, so runs on different commits can be diffed directly.
+"""
+import argparse
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+
+import pdf_utils
+from stub_embed_server import StubEmbedServer
+from synthetic_pdf import write_policy_pdf
+from vectordb import get_vectorstore
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """Returns vectors computed in the embedding stage, so the upsert stage
+    measures Chroma alone."""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+def timed(name, items, unit, func):
+    started = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - started
+    count = items(result) if callable(items) else items
+    return result, {"stage": name, "seconds": round(seconds, 4), unit: count,
+                    f"{unit}_per_sec": round(count / max(seconds, 1e-9), 1),
+                    "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+
+def bench_stages(pdf_file, workdir, base_url, batch_size):
+    stages = []
+    pages, stage = timed("parse", len, "pages", lambda: list(pdf_utils.load_pdf_pages(pdf_file)))
+    stages.append(stage)
+
+    chunks, stage = timed("split", len, "chunks", lambda: pdf_utils.get_text_splitter().split_documents(pages))
+    stages.append(stage)
+
+    texts = [chunk.page_content for chunk in chunks]
+    embeddings = OllamaEmbeddings(model=pdf_utils.model_embedding, base_url=base_url)
+
+    def embed():
+        vectors = []
+        for i in range(0, len(texts), batch_size):
+            vectors.extend(embeddings.embed_documents(texts[i:i + batch_size]))
+        return vectors
+
+    vectors, stage = timed("embed", len(texts), "chunks", embed)
+    stages.append(stage)
+
+    vectorstore = get_vectorstore(collection_name="bench", embedding_function=PrecomputedEmbeddings(dict(zip(texts, vectors))),
+                                  persist_directory=os.path.join(workdir, "chroma_db"), allow_import=True)
+    ids = [f"chunk_{i}" for i in range(len(chunks))]
+
+    def upsert():
+        for i in range(0, len(chunks), batch_size):
+            vectorstore.add_documents(chunks[i:i + batch_size], ids=ids[i:i + batch_size])
+
+    _, stage = timed("upsert", len(chunks), "chunks", upsert)
+    stages.append(stage)
+    return stages
+
+
+def run_end_to_end(pdf_file, workdir, base_url, batch_size):
+    """get_pdf_text_emd in a fresh process, so its peak RSS stands alone."""
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", "--pdf", pdf_file,
+                          "--base-url", base_url, "--batch-size", str(batch_size)],
+                         cwd=workdir, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def worker(pdf_file, base_url, batch_size):
+    embeddings = OllamaEmbeddings(model=pdf_utils.model_embedding, base_url=base_url)
+    stats = pdf_utils.IngestStats("bench")
+    started = time.perf_counter()
+    pdf_utils.get_pdf_text_emd(pdf_file, batch_size=batch_size, embeddings=embeddings, stats=stats)
+    seconds = time.perf_counter() - started
+    print(json.dumps({"stage": "end_to_end", "seconds": round(seconds, 4), "pages": stats.pages,
+                      "chunks": stats.chunks, "chunks_per_sec": round(stats.chunks / max(seconds, 1e-9), 1),
+                      "stage_seconds": {k: round(v, 4) for k, v in stats.stage_seconds.items()},
+                      "peak_rss_mb": round(peak_rss_mb(), 1)}))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default="10,100,500", help="comma separated page counts, one PDF each")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated latency per embed request")
+    parser.add_argument("--per-text-ms", type=float, default=0.0, help="simulated cost per embedded chunk")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.pdf, args.base_url, args.batch_size)
+        return
+
+    server = StubEmbedServer(latency_ms=args.latency_ms, per_text_ms=args.per_text_ms).start()
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": {"batch_size": args.batch_size, "latency_ms": args.latency_ms, "per_text_ms": args.per_text_ms,
+                   "chunk_size": pdf_utils.chunk_size, "chunk_overlap": pdf_utils.chunk_overlap},
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in [int(p) for p in args.pages.split(",") if p]:
+            workdir = os.path.join(tmp, f"{pages}_pages")
+            os.makedirs(workdir)
+            pdf_file = write_policy_pdf(os.path.join(workdir, f"policy_{pages}.pdf"), pages, seed=pages)
+            print(f"Benchmarking {pages} pages...", file=sys.stderr)
+            stages = bench_stages(pdf_file, workdir, server.base_url, args.batch_size)
+            e2e_dir = os.path.join(workdir, "end_to_end")
+            os.makedirs(e2e_dir)
+            stages.append(run_end_to_end(pdf_file, e2e_dir, server.base_url, args.batch_size))
+            results["runs"].append({"pages": pages, "pdf_bytes": os.path.getsize(pdf_file), "stages": stages})
+    server.shutdown()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Prompt-eval time saved by the static prompt prefix, against a real Ollama.
+
+    python benchmarks/bench_prompt_prefix.py --requests 20 --output prefix.json
+
+Sends the same questions twice through /api/generate with num_predict=1, so
+the timings are almost entirely prompt evaluation:
+
+  static   prompts from pdf_utils.build_prompt; the shared prefix is reused
+  cold     the same prompts with a per-request line in front, so no prefix
+           can be reused (what every request paid before)
+
+For each mode it reports Ollama's own prompt_eval_count and
+prompt_eval_duration per request, and the per-request time saved.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import urllib.request
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pdf_utils
+from bench_ingest import git_commit
+from synthetic_pdf import KINDS, SECTIONS, page_lines
+
+QUESTIONS = [
+    "How many {kind} leaves do I get per year?",
+    "Can I carry forward unused {kind} leave?",
+    "What is the approval limit for reimbursements under {section}?",
+    "How long is the probation period?",
+    "What happens if I violate the {section} policy?",
+]
+
+
+def make_requests(count, seed=0):
+    """(question, context) pairs that look like what the app sends."""
+    rng = random.Random(seed)
+    requests = []
+    for i in range(count):
+        question = rng.choice(QUESTIONS).format(kind=rng.choice(KINDS), section=rng.choice(SECTIONS))
+        chunks = ["\n".join(page_lines(rng, rng.randint(0, 99), 8)) for _ in range(3)]
+        context = "\n\n---\n\n".join(f"[From: policy.pdf, Page: {rng.randint(1, 40)}]\n{chunk}" for chunk in chunks)
+        requests.append((question, context))
+    return requests
+
+
+def generate(base_url, prompt):
+    body = json.dumps({"model": pdf_utils.model_llm, "prompt": prompt, "stream": False,
+                       "keep_alive": pdf_utils.llm_keep_alive,
+                       "options": {"num_predict": 1, "temperature": 0, "num_ctx": pdf_utils.llm_num_ctx}}).encode()
+    request = urllib.request.Request(f"{base_url}/api/generate", data=body,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=600) as response:
+        return json.loads(response.read())
+
+
+def run_mode(base_url, mode, requests):
+    rows = []
+    for i, (question, context) in enumerate(requests):
+        prompt = pdf_utils.build_prompt(question, context)
+        if mode == "cold":
+            prompt = f"Request {i} of a {mode} run ({random.random():.12f}).\n{prompt}"
+        result = generate(base_url, prompt)
+        rows.append({"prompt_eval_count": result.get("prompt_eval_count", 0),
+                     "prompt_eval_ms": result.get("prompt_eval_duration", 0) / 1e6,
+                     "total_ms": result.get("total_duration", 0) / 1e6})
+    return {"mode": mode, "requests": len(rows),
+            "mean_prompt_eval_count": round(statistics.mean(r["prompt_eval_count"] for r in rows), 1),
+            "mean_prompt_eval_ms": round(statistics.mean(r["prompt_eval_ms"] for r in rows), 1),
+            "p50_total_ms": round(statistics.median(r["total_ms"] for r in rows), 1),
+            "rows": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:11434")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    requests = make_requests(args.requests)
+    # Load the model first so neither mode pays for it
+    generate(args.base_url, pdf_utils.build_prompt("warm up"))
+    runs = [run_mode(args.base_url, mode, requests) for mode in ("cold", "static")]
+    cold, static = runs
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": {"model": pdf_utils.model_llm, "keep_alive": pdf_utils.llm_keep_alive, "num_ctx": pdf_utils.llm_num_ctx,
+                   "static_prefix_chars": len(pdf_utils.static_prompt_prefix)},
+        "runs": runs,
+        "saved_prompt_eval_ms_per_request": round(cold["mean_prompt_eval_ms"] - static["mean_prompt_eval_ms"], 1),
+        "saved_prompt_tokens_per_request": round(cold["mean_prompt_eval_count"] - static["mean_prompt_eval_count"], 1),
+    }
+    print(f"Prompt eval per request: cold {cold['mean_prompt_eval_ms']} ms, "
+          f"static prefix {static['mean_prompt_eval_ms']} ms", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
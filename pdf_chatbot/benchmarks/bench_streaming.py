@@ -0,0 +1,120 @@
+"""Peak RSS of batch vs streaming ingestion of synthetic PDFs of growing size.
+
+    python benchmarks/bench_streaming.py --pages 200,1000,4000
+
+Every (store, mode, pages) run gets its own subprocess and a fresh Chroma
+directory, so the peak RSS reported for one run is not inflated by another.
+Embeddings come from a hash-based stub so the numbers measure our pipeline,
+not Ollama. With the "null" store the vectors are discarded instead of being
+written to Chroma, whose in-memory index grows with the collection whatever
+the mode; that run shows the pipeline's own memory, which in streaming mode
+should stay flat as the page count grows.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from stub_embed_server import hash_vector
+from synthetic_pdf import write_policy_pdf
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic 768-dim vectors derived from the text hash."""
+
+    def embed_documents(self, texts):
+        return [hash_vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return hash_vector(text)
+
+
+class NullVectorStore(VectorStore):
+    """Embeds what is added like a real store, then drops it."""
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+        raise NotImplementedError
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        self.embedding_function.embed_documents(list(texts))
+        return list(ids or [])
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return []
+
+    def get(self, ids=None, **kwargs):
+        return {"ids": [], "documents": [], "metadatas": []}
+
+    def delete(self, ids=None, **kwargs):
+        pass
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_worker(mode, pdf_file, batch_size, store):
+    import pdf_utils
+
+    if store == "null":
+        pdf_utils.get_vectorstore = lambda collection_name, embedding_function, **kwargs: \
+            NullVectorStore(embedding_function)
+
+    # Importing langchain/chromadb alone costs a few hundred MB; report it
+    # separately so the ingestion overhead is visible.
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    pdf_utils.get_pdf_text_emd(pdf_file, streaming=(mode == "streaming"), batch_size=batch_size,
+                               embeddings=HashEmbeddings())
+    print(json.dumps({"store": store, "mode": mode, "seconds": round(time.perf_counter() - started, 2),
+                      "baseline_rss_mb": round(baseline, 1), "peak_rss_mb": round(peak_rss_mb(), 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", default="200,1000,4000", help="comma-separated page counts")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--stores", default="null,chroma")
+    parser.add_argument("--worker", choices=["batch", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--store", default="chroma", help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.pdf, args.batch_size, args.store)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in [int(p) for p in args.pages.split(",")]:
+            pdf_file = write_policy_pdf(os.path.join(tmp, f"handbook_{pages}.pdf"), pages)
+            print(f"Synthetic PDF: {pages} pages, {os.path.getsize(pdf_file) / 1e6:.1f} MB")
+            for store in args.stores.split(","):
+                for mode in ("batch", "streaming"):
+                    workdir = os.path.join(tmp, f"{store}_{mode}_{pages}")
+                    os.makedirs(workdir)
+                    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", mode,
+                                          "--store", store, "--pdf", pdf_file, "--batch-size", str(args.batch_size)],
+                                         cwd=workdir, capture_output=True, text=True, check=True).stdout
+                    result = json.loads(out.strip().splitlines()[-1])
+                    print(f"{store:>7} {mode:>10} {pages:>6} pages: {result['seconds']:8.2f}s  "
+                          f"peak RSS {result['peak_rss_mb']:8.1f} MB "
+                          f"(+{result['peak_rss_mb'] - result['baseline_rss_mb']:.1f} MB over imports)", flush=True)
+
+
+if __name__ == "__main__":
+    main()
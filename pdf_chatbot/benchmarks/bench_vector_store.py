@@ -0,0 +1,127 @@
+"""Query latency and recall of the Chroma and NumPy vector stores.
+
+    python benchmarks/bench_vector_store.py --chunks 1000,10000,100000 --output stores.json
+
+For every collection size it loads the same synthetic vectors into both
+backends of vectordb.get_vectorstore and times
+similarity_search_by_vector_with_relevance_scores, which is what
+FederatedRetriever calls. Vectors are drawn around a few hundred cluster
+centres, like embeddings of chunks from related policies, and queries are
+perturbed copies of stored vectors. Recall@k is measured against an exact
+float64 search; a query with a metadata filter (one source PDF out of 100)
+is timed separately.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from langchain_core.documents import Document
+
+from bench_ingest import PrecomputedEmbeddings, git_commit
+from vectordb import get_vectorstore
+
+
+def make_vectors(count, dim, rng, clusters=256):
+    centres = rng.standard_normal((clusters, dim))
+    vectors = centres[rng.integers(0, clusters, count)] + 0.6 * rng.standard_normal((count, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_queries(vectors, count, rng):
+    queries = vectors[rng.integers(0, len(vectors), count)] + 0.05 * rng.standard_normal((count, vectors.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def exact_top_k(vectors, queries, k):
+    scores = queries.astype(np.float64) @ vectors.astype(np.float64).T
+    return [set(row[:k]) for row in np.argsort(-scores, axis=1)]
+
+
+def bench_backend(backend, vectors, queries, truth, k, workdir, batch_size):
+    texts = [f"chunk {i}" for i in range(len(vectors))]
+    embeddings = PrecomputedEmbeddings(dict(zip(texts, vectors.tolist())))
+    vectorstore = get_vectorstore(collection_name=f"bench_{len(vectors)}", embedding_function=embeddings,
+                                  persist_directory=os.path.join(workdir, backend), backend=backend,
+                                  allow_import=True)
+    documents = [Document(page_content=text, metadata={"source": f"doc{i % 100}.pdf", "page": i % 40})
+                 for i, text in enumerate(texts)]
+    started = time.perf_counter()
+    for i in range(0, len(documents), batch_size):
+        vectorstore.add_documents(documents[i:i + batch_size], ids=[str(j) for j in range(i, min(i + batch_size, len(documents)))])
+    build_seconds = time.perf_counter() - started
+
+    # warm up caches and lazily built indexes before timing
+    for query in queries[:5]:
+        vectorstore.similarity_search_by_vector_with_relevance_scores(query.tolist(), k=k)
+
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        hits = vectorstore.similarity_search_by_vector_with_relevance_scores(query.tolist(), k=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len({int(doc.id) for doc, _ in hits} & expected) / k)
+
+    filtered = []
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        vectorstore.similarity_search_by_vector_with_relevance_scores(query.tolist(), k=k,
+                                                                      filter={"source": f"doc{i % 100}.pdf"})
+        filtered.append((time.perf_counter() - started) * 1000)
+
+    latencies.sort()
+    return {"backend": backend, "chunks": len(vectors), "build_seconds": round(build_seconds, 2),
+            "p50_ms": round(statistics.median(latencies), 3),
+            "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+            "filtered_p50_ms": round(statistics.median(filtered), 3),
+            f"recall_at_{k}": round(statistics.mean(recalls), 4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", default="1000,10000,100000", help="comma-separated collection sizes")
+    parser.add_argument("--dim", type=int, default=768, help="nomic-embed-text vectors have 768 dimensions")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--backends", default="chroma,numpy")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for count in [int(c) for c in args.chunks.split(",")]:
+            vectors = make_vectors(count, args.dim, rng)
+            queries = make_queries(vectors, args.queries, rng)
+            truth = exact_top_k(vectors, queries, args.k)
+            for backend in args.backends.split(","):
+                run = bench_backend(backend, vectors, queries, truth, args.k, workdir, args.batch_size)
+                print(f"{backend:>6} {count:>7} chunks: p50 {run['p50_ms']} ms, "
+                      f"recall@{args.k} {run[f'recall_at_{args.k}']}", file=sys.stderr)
+                runs.append(run)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": {"dim": args.dim, "queries": args.queries, "k": args.k},
+        "runs": runs,
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Minimal stand-in for Ollama's /api/embed endpoint.
+
+    python benchmarks/stub_embed_server.py --port 11435 --latency-ms 20
+
+Point OllamaEmbeddings at it with base_url="http://127.0.0.1:11435". Vectors
+are derived from the text hash, so identical chunks always get identical
+embeddings, and `latency_ms` plus `per_text_ms` simulate the model cost.
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def hash_vector(text, dim=768):
+    seed = hashlib.sha256(text.encode("utf-8")).digest()
+    return [seed[i % len(seed)] / 255.0 for i in range(dim)]
+
+
+class StubEmbedServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, dim=768, latency_ms=0.0, per_text_ms=0.0):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.per_text_ms = per_text_ms
+        self.requests = 0
+        self.texts = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path not in ("/api/embed", "/api/embeddings"):
+            self.send_error(404)
+            return
+        texts = body.get("input", body.get("prompt", ""))
+        texts = [texts] if isinstance(texts, str) else texts
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.texts += len(texts)
+        time.sleep((server.latency_ms + server.per_text_ms * len(texts)) / 1000.0)
+
+        vectors = [hash_vector(text, server.dim) for text in texts]
+        if self.path == "/api/embeddings":
+            payload = {"embedding": vectors[0]}
+        else:
+            payload = {"model": body.get("model", "stub"), "embeddings": vectors}
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--per-text-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = StubEmbedServer(args.port, args.dim, args.latency_ms, args.per_text_ms)
+    print(f"Stub embedding server on {server.base_url}")
+    server.serve_forever()
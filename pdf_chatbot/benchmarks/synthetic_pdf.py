@@ -0,0 +1,71 @@
+import random
+
+SECTIONS = [
+    "Leave Policy", "Attendance", "Probation and Confirmation", "Relocation", "Career Development",
+    "IT Acceptable Use", "Travel Reimbursement", "Code of Conduct", "Anti-Harassment", "Remote Work",
+]
+
+SENTENCES = [
+    "Employees are entitled to {n} days of {kind} leave per calendar year.",
+    "Requests must be submitted to the reporting manager at least {n} working days in advance.",
+    "Unused {kind} leave may be carried forward up to a maximum of {n} days.",
+    "The probation period is {n} months and may be extended once by the HR department.",
+    "Reimbursement claims above {n} INR require approval from the department head.",
+    "Access to company systems during {kind} leave must be documented in the HRMS portal.",
+    "Violations of this section may lead to disciplinary action as described in Section {n}.",
+    "Employees relocating for business reasons are eligible for a one-time allowance of {n} INR.",
+]
+
+KINDS = ["sick", "casual", "earned", "maternity", "paternity", "bereavement"]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_lines(rng, page_number, lines_per_page):
+    section = SECTIONS[page_number % len(SECTIONS)]
+    lines = [f"HRP{page_number % 20:03d} {section} - Section {page_number // len(SECTIONS) + 1}.{page_number % 7 + 1}"]
+    for _ in range(lines_per_page - 1):
+        lines.append(rng.choice(SENTENCES).format(n=rng.randint(1, 60), kind=rng.choice(KINDS)))
+    return lines
+
+
+def write_policy_pdf(path, pages, lines_per_page=45, seed=0):
+    """Write a text-only PDF of `pages` pages of policy-like sentences.
+
+    The file is assembled by hand (Helvetica, one content stream per page)
+    so benchmarks need nothing beyond the standard library to create it,
+    and pypdf extracts roughly 3KB of text per page from it.
+    """
+    rng = random.Random(seed)
+    font_obj = 3 + 2 * pages
+    offsets = {}
+
+    with open(path, "wb") as f:
+        def write_obj(number, body):
+            offsets[number] = f.tell()
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n")
+        write_obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+        write_obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+
+        for i in range(pages):
+            page_obj, content_obj = 3 + 2 * i, 4 + 2 * i
+            write_obj(page_obj, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                                 f"/Contents {content_obj} 0 R "
+                                 f"/Resources << /Font << /F1 {font_obj} 0 R >> >> >>").encode())
+            text = " ".join(f"({_escape(line)}) '" for line in page_lines(rng, i, lines_per_page))
+            stream = f"BT /F1 9 Tf 40 760 Td 16 TL {text} ET".encode()
+            write_obj(content_obj, f"<< /Length {len(stream)} >>\nstream\n".encode() + stream + b"\nendstream")
+
+        write_obj(font_obj, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+        xref_offset = f.tell()
+        f.write(f"xref\n0 {font_obj + 1}\n0000000000 65535 f \n".encode())
+        for number in range(1, font_obj + 1):
+            f.write(f"{offsets[number]:010d} 00000 n \n".encode())
+        f.write(f"trailer << /Size {font_obj + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+    return path
@@ -0,0 +1,105 @@
+import os
+import re
+
+_token_pattern = re.compile(r"\w+|[^\w\s]")
+
+# Chunks sharing more than this fraction of their word 8-grams with context
+# already packed (the same PDF in two collections, or near-identical
+# sections) are left out.
+duplicate_overlap = 0.5
+
+# Neighbouring chunks of a PDF repeat up to the splitter's chunk_overlap
+# (200 chars). When a chunk's neighbour is already packed, the text they
+# share is cut from the chunk, if it is at least min_overlap_chars long.
+max_overlap_chars = 400
+min_overlap_chars = 20
+
+
+def estimate_tokens(text):
+    """Token count of `text` for the LLM, estimated as words plus punctuation.
+
+    Llama 3's tokenizer is not available locally; on English policy text
+    this lands within ~15% of it, which is what the budget below allows for.
+    """
+    return len(_token_pattern.findall(text))
+
+
+def chunk_tokens(doc):
+    # Counted once at ingestion; older chunks are counted here
+    tokens = doc.metadata.get("tokens")
+    return tokens if tokens is not None else estimate_tokens(doc.page_content)
+
+
+def _shingles(text, size=8):
+    words = text.lower().split()
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def format_chunk(doc, body=None):
+    source = doc.metadata.get('source', 'Unknown source')
+    page = doc.metadata.get('page', 'Unknown page')
+    return f"[From: {os.path.basename(str(source))}, Page: {page}]\n{doc.page_content if body is None else body}"
+
+
+def _neighbours(doc):
+    """Keys of the chunks before and after `doc` in its PDF, or (None, None).
+
+    Chunk IDs are "<content>_<index>" (see ingest_manifest.chunk_id).
+    """
+    content, _, idx = (doc.id or "").rpartition("_")
+    if not content or not idx.isdigit():
+        return None, None
+    collection = doc.metadata.get("collection")
+    return (collection, f"{content}_{int(idx) - 1}"), (collection, f"{content}_{int(idx) + 1}")
+
+
+def _overlap(before, after):
+    """Length of the longest suffix of `before` that `after` starts with."""
+    for size in range(min(len(before), len(after), max_overlap_chars), min_overlap_chars - 1, -1):
+        if before.endswith(after[:size]):
+            return size
+    return 0
+
+
+separator = "\n\n---\n\n"
+
+
+def pack_context(docs, budget):
+    """Fill `budget` tokens with `docs`, most relevant first.
+
+    `docs` must be in relevance order. A chunk that does not fit is skipped
+    and smaller, less relevant ones may still fill the space it left. Text a
+    chunk shares with a packed neighbour is only included once.
+    Returns (context, packed_docs, tokens_used).
+    """
+    packed = []
+    parts = []
+    seen = set()
+    bodies = {}                # (collection, chunk id) -> packed text
+    used = 0
+    separator_tokens = estimate_tokens(separator)
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if len(shingles & seen) > duplicate_overlap * len(shingles):
+            continue
+        body = doc.page_content
+        previous, following = _neighbours(doc)
+        if previous in bodies:
+            body = body[_overlap(bodies[previous], body):]
+        if following in bodies:
+            body = body[:len(body) - _overlap(body, bodies[following])]
+        if not body.strip():
+            continue
+        text = format_chunk(doc, body)
+        # the header line is counted too; an untrimmed body's count comes from metadata
+        body_tokens = chunk_tokens(doc) if body is doc.page_content else estimate_tokens(body)
+        cost = body_tokens + estimate_tokens(text[:text.index("\n")]) + (separator_tokens if parts else 0)
+        if used + cost > budget:
+            continue
+        packed.append(doc)
+        parts.append(text)
+        seen |= shingles
+        if previous is not None:
+            bodies[(previous[0], doc.id)] = body
+        used += cost
+    return separator.join(parts), packed, used
@@ -1,15 +1,92 @@
+import argparse
+import json
 import os 
+import queue
 import sys 
+import threading
+import time
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from pdf_utils import get_pdf_text_emd
-from vectordb import pdf_file_path
+from pdf_utils import IngestPools, IngestStats, get_ingest_embeddings, get_pdf_text_emd
+from vectordb import collection_folders, pdf_file_path
 
 
 # print(os.path.basename(pdf_file_path).lower())
 log_file="processed_pdfs.txt"
 output_folder="extracted_texts"
 
+# Parallel ingestion: processes that parse/split PDFs and threads that send
+# chunks to Ollama. Set both to 1 to process one PDF at a time.
+parse_workers = max(1, (os.cpu_count() or 2) - 1)
+embed_workers = 4
+# Chunks per embedding request and how many requests may be open at once
+embed_batch_size = 64
+embed_max_in_flight = 4
+
+
+def run_jobs(jobs, job_workers=1, progress_interval=5.0, streaming=False):
+    """Refresh several collections in one process.
+
+    `jobs` is a list of (directory, collection_name) pairs. They are taken
+    from a queue by `job_workers` threads and all share one set of worker
+    pools, one progress counter and one warm embedding client.
+    """
+    embeddings = get_ingest_embeddings()
+    pools = IngestPools(parse_workers, embed_workers, embed_max_in_flight)
+    stats = IngestStats("all collections")
+    job_queue = queue.Queue()
+    for job in jobs:
+        job_queue.put(job)
+
+    def worker():
+        while True:
+            try:
+                directory, collection_name = job_queue.get_nowait()
+            except queue.Empty:
+                return
+            started = time.perf_counter()
+            print(f"Job {collection_name}: {directory}")
+            try:
+                get_pdf_text_emd(directory, log_file=log_file, output_folder=output_folder,
+                                 batch_size=embed_batch_size, streaming=streaming, embeddings=embeddings,
+                                 collection_name=collection_name, pools=pools, stats=stats)
+            except Exception as e:
+                print(f"Job {collection_name} failed: {e}")
+            print(f"Job {collection_name} finished in {time.perf_counter() - started:.1f}s")
+
+    stats.start_progress(progress_interval)
+    threads = [threading.Thread(target=worker) for _ in range(max(1, job_workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.stop_progress()
+    pools.close()
+    stats.report()
+    print(f"Embedding cache: {embeddings.hits} hits, {embeddings.misses} misses")
+
+
+def load_jobs(path):
+    # {"<directory>": "<collection>", ...}
+    with open(path, "r") as f:
+        return [(directory, collection_name) for directory, collection_name in json.load(f).items()]
+
+
 if __name__ == '__main__':
-    print("Loading PDF and extracting text...")
-    pdf_file_path = pdf_file_path
-    get_pdf_text_emd(pdf_file_path)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest PDFs into Chroma collections.")
+    parser.add_argument("--jobs", help="JSON file mapping PDF directories to collection names")
+    parser.add_argument("--all", action="store_true", help="refresh every folder in vectordb.collection_folders")
+    parser.add_argument("--job-workers", type=int, default=1, help="collections ingested at the same time")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument("--streaming", action="store_true", help="stream pages with bounded memory")
+    args = parser.parse_args()
+
+    if args.jobs or args.all:
+        jobs = load_jobs(args.jobs) if args.jobs else [(d, c) for c, d in collection_folders.items()]
+        run_jobs(jobs, args.job_workers, args.progress_interval, args.streaming)
+    else:
+        print("Loading PDF and extracting text...")
+        pdf_file_path = pdf_file_path
+        get_pdf_text_emd(pdf_file_path, log_file=log_file, output_folder=output_folder,
+                         parse_workers=parse_workers, embed_workers=embed_workers,
+                         batch_size=embed_batch_size, max_in_flight=embed_max_in_flight,
+                         streaming=args.streaming)
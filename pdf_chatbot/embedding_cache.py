@@ -0,0 +1,222 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_query(text):
+    # "How many sick leaves?" and "how many  sick leaves? " share one entry
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """On-disk vector cache keyed by (embedding model, sha256 of the chunk text).
+
+    Every collection shares the same SQLite file, so a PDF that is already
+    embedded for one team costs only a Chroma upsert when it is added to
+    another. Once `max_entries` is exceeded the least recently used vectors
+    are evicted, down to `evict_to` of it so the next eviction is a while off.
+
+    The entry count is tracked in memory (counting every put as new, so it
+    can only overstate) and only recounted when it passes `max_entries`.
+    Reads record their last_used time in memory and write them out in
+    batches of `touch_batch`, or with the next put or eviction.
+    """
+
+    touch_batch = 256
+    evict_to = 0.9
+
+    def __init__(self, path, max_entries=500_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.touched = {}          # (model, text_hash) -> last_used not yet written
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash))""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self.conn.commit()
+        self.count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model, hashes):
+        """Return {text_hash: vector} for the hashes that are cached."""
+        found = {}
+        if not hashes:
+            return found
+        unique = list(dict.fromkeys(hashes))
+        with self.lock:
+            # SQLite caps the number of bound parameters, so look up in slices
+            for i in range(0, len(unique), 500):
+                part = unique[i:i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({marks})",
+                    [model, *part]).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            now = time.time()
+            for key in found:
+                self.touched[(model, key)] = now
+            if len(self.touched) >= self.touch_batch:
+                self._write_touched()
+                self.conn.commit()
+        return found
+
+    def put_many(self, model, items):
+        """Store an iterable of (text_hash, vector) pairs."""
+        now = time.time()
+        rows = [(model, key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items]
+        if not rows:
+            return
+        with self.lock:
+            self._write_touched()
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self.conn.commit()
+            self.count += len(rows)
+            if self.count > self.max_entries:
+                self._evict()
+
+    def _write_touched(self):
+        if self.touched:
+            self.conn.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                                  [(now, model, key) for (model, key), now in self.touched.items()])
+            self.touched = {}
+
+    def _evict(self):
+        self.count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self.count <= self.max_entries:
+            return
+        keep = int(self.max_entries * self.evict_to)
+        self.conn.execute("""
+            DELETE FROM embeddings WHERE rowid IN (
+                SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)""", (self.count - keep,))
+        self.conn.commit()
+        self.count = keep
+
+
+class QueryEmbeddingCache:
+    """Query vectors keyed by normalized query text, for one embedding model.
+
+    An in-memory LRU of `max_entries` answers repeated questions without a
+    round trip to Ollama; with `disk_cache` (an EmbeddingCache) vectors also
+    survive restarts. Query vectors are stored under "<model>#query" so they
+    never mix with document vectors of the same text.
+    """
+
+    def __init__(self, model, max_entries=1024, disk_cache=None):
+        self.model = model
+        self.disk_model = f"{model}#query"
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, text):
+        key = text_hash(normalize_query(text))
+        with self.lock:
+            vector = self.entries.get(key)
+            if vector is not None:
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+        if self.disk_cache is not None:
+            vector = self.disk_cache.get_many(self.disk_model, [key]).get(key)
+            if vector is not None:
+                self._remember(key, vector)
+                with self.lock:
+                    self.disk_hits += 1
+                return vector
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, vector):
+        key = text_hash(normalize_query(text))
+        self._remember(key, vector)
+        if self.disk_cache is not None:
+            self.disk_cache.put_many(self.disk_model, [(key, vector)])
+
+    def _remember(self, key, vector):
+        with self.lock:
+            self.entries[key] = vector
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                    "entries": len(self.entries)}
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends texts missing from `cache` to `embeddings`.
+
+    With a `query_cache`, embed_query() is served from it as well.
+    """
+
+    def __init__(self, embeddings, cache, model, query_cache=None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+        self.query_cache = query_cache
+        self.lock = threading.Lock()   # the ingestion request pool embeds from several threads
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        hashes = [text_hash(text) for text in texts]
+        found = self.cache.get_many(self.model, hashes)
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing, vectors))
+            self.cache.put_many(self.model, computed.items())
+            found.update(computed)
+
+        with self.lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        return [found[key] for key in hashes]
+
+    def embed_query(self, text):
+        if self.query_cache is None:
+            return self.embeddings.embed_query(text)
+        vector = self.query_cache.get(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.query_cache.put(text, vector)
+        return vector
+
+    async def aembed_query(self, text):
+        if self.query_cache is None:
+            return await self.embeddings.aembed_query(text)
+        vector = self.query_cache.get(text)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.query_cache.put(text, vector)
+        return vector
@@ -0,0 +1,145 @@
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EmbeddingBatchError(Exception):
+    """Raised when some batches of a PDF still fail after every retry."""
+
+
+class BatchEmbedder:
+    """Embeds chunks in fixed-size batches and upserts each batch as soon as it is done.
+
+    At most `max_in_flight` batches are being embedded at any time, whichever
+    PDF they belong to. A failed batch is retried with exponential backoff.
+    If it still fails, it is split in halves (without further retries) until
+    the chunks that fail on their own are found; those are skipped and
+    logged and the rest of the batch is written. Only when every chunk of a
+    batch fails, which points at the server rather than the chunks, does
+    the batch fail its own PDF, whose batches already written are then
+    rolled back by pdf_utils.embed_and_commit.
+    """
+
+    def __init__(self, vectorstore, batch_size=64, max_in_flight=4, max_retries=3, backoff=1.0,
+                 pool=None, stats=None):
+        self.vectorstore = vectorstore
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_in_flight = max_in_flight
+        # A pool passed in is shared with other embedders and left open on close()
+        self.own_pool = pool is None
+        self.pool = pool or ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed")
+        self.stats = stats
+        self.lock = threading.Lock()
+        self.embedded = 0
+        self.batches = 0
+        self.retries = 0
+        self.skipped = 0
+        self.first_started = None
+        self.last_finished = None
+
+    def add_documents(self, documents, ids):
+        return self.add_stream(zip(documents, ids))
+
+    def add_stream(self, items, skip_batches=(), on_batch=None):
+        """Embed and upsert an iterable of (Document, id) pairs; return the IDs.
+
+        The iterable is consumed lazily: once `max_in_flight` batches are
+        being embedded and as many more are queued, reading pauses until a
+        batch finishes. Batches whose index is in `skip_batches` were written
+        by an earlier run and are only counted; `on_batch(index, skipped)` is
+        called after each batch is upserted, with the IDs of its chunks that
+        were skipped because they fail to embed.
+        """
+        slots = threading.BoundedSemaphore(self.max_in_flight * 2)
+        futures, ids = [], []
+        items = iter(items)
+        for index in itertools.count():
+            batch = list(itertools.islice(items, self.batch_size))
+            if not batch:
+                break
+            documents = [document for document, _ in batch]
+            batch_ids = [chunk_id for _, chunk_id in batch]
+            ids.extend(batch_ids)
+            if index in skip_batches:
+                continue
+            slots.acquire()
+            future = self.pool.submit(self._add_batch, documents, batch_ids, index, on_batch)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise EmbeddingBatchError(f"{len(errors)} of {len(futures)} batches failed: {errors[0]}")
+        return ids
+
+    def _add_batch(self, documents, ids, index=None, on_batch=None):
+        started = time.perf_counter()
+        with self.lock:
+            if self.first_started is None:
+                self.first_started = started
+        skipped = []
+        try:
+            self._upsert(documents, ids, self.max_retries)
+        except Exception as e:
+            skipped = self._bisect(documents, ids) if len(documents) > 1 else list(ids)
+            if len(skipped) == len(ids):
+                raise
+            print(f"Skipped {len(skipped)} chunks that fail to embed ({e}): {', '.join(skipped)}")
+        finished = time.perf_counter()
+        with self.lock:
+            self.embedded += len(documents) - len(skipped)
+            self.skipped += len(skipped)
+            self.batches += 1
+            self.last_finished = finished
+        if self.stats is not None:
+            self.stats.add_stage("embed", finished - started)
+        if on_batch is not None:
+            on_batch(index, skipped)
+
+    def _upsert(self, documents, ids, retries):
+        for attempt in range(retries + 1):
+            try:
+                self.vectorstore.add_documents(documents, ids=ids)
+                return
+            except Exception:
+                if attempt == retries:
+                    raise
+                with self.lock:
+                    self.retries += 1
+                time.sleep(self.backoff * (2 ** attempt) * (0.5 + random.random()))
+
+    def _bisect(self, documents, ids):
+        # Upsert both halves of a failing batch; return the IDs of the
+        # chunks that still fail on their own
+        skipped = []
+        middle = len(documents) // 2
+        for part in (slice(None, middle), slice(middle, None)):
+            try:
+                self._upsert(documents[part], ids[part], 0)
+            except Exception:
+                skipped += self._bisect(documents[part], ids[part]) if len(ids[part]) > 1 else ids[part]
+        return skipped
+
+    def throughput(self):
+        """Chunks embedded and written per second of wall time spent embedding."""
+        with self.lock:
+            if not self.embedded:
+                return 0.0
+            return self.embedded / max(self.last_finished - self.first_started, 1e-9)
+
+    def report(self):
+        print(f"Embedded {self.embedded} chunks in {self.batches} batches "
+              f"({self.throughput():.1f} embeddings/sec, {self.retries} retries, {self.skipped} skipped)")
+
+    def close(self):
+        if self.own_pool:
+            self.pool.shutdown(wait=True)
@@ -0,0 +1,296 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(file_hash, idx):
+    # Keyed by content like the manifest: an edited PDF gets fresh IDs, so
+    # chunks still referenced by an alias of its old content are untouched
+    return f"{file_hash[:16]}_{idx}"
+
+
+def content_key(chunk_id):
+    """The ingested content (one version of one PDF) a chunk belongs to.
+
+    Chunks of PDFs imported from the legacy log are keyed "<name>_<idx>"
+    and map to the PDF name instead.
+    """
+    return chunk_id.rsplit("_", 1)[0]
+
+
+def manifest_path(output_folder_path, collection_name):
+    return os.path.join(output_folder_path, f"{collection_name}_manifest.json")
+
+
+def read_legacy_log(log_file_path):
+    """PDF names in an old `<collection>_processed_pdfs.txt` log, in order."""
+    if not os.path.exists(log_file_path):
+        return []
+    with open(log_file_path, "r") as f:
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+
+class IngestManifest:
+    """Per-collection record of what has been ingested, keyed by content hash.
+
+    `files` maps a PDF's sha256 to its source name, chunk IDs, page count and
+    the embedding model used. `paths` maps each PDF name to the hash, size and
+    mtime it had when it was last seen, so an untouched file is recognised
+    from a stat() alone and only files whose stat changed get hashed.
+
+    `generation` grows by one whenever a PDF is added, replaced or removed,
+    and `content_generations` remembers the generation at which the chunks
+    of each content_key() were last added, deleted or re-pointed at another
+    source name. Caches record the content keys of the chunks an entry was
+    built from, so they are invalidated by exactly those changes.
+
+    When the name an entry's chunks cite is forgotten or takes new content
+    while an alias of the old content remains, the entry's source moves to
+    that alias; take_moved_sources() tells ingestion which chunks' "source"
+    metadata to rewrite.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.files = {}
+        self.paths = {}
+        self.generation = 0
+        self.content_generations = {}
+        self.moved_sources = []    # (new source, chunk IDs) not yet applied to the store
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            self.paths = data.get("paths", {})
+            self.generation = data.get("generation", 0)
+            self.content_generations = data.get("content_generations", {})
+
+    def save(self):
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"version": 1, "generation": self.generation, "files": self.files,
+                           "paths": self.paths, "content_generations": self.content_generations}, f)
+            os.replace(tmp_path, self.path)
+
+    def _bump(self, chunk_ids):
+        self.generation += 1
+        for key in {content_key(chunk_id) for chunk_id in chunk_ids}:
+            self.content_generations[key] = self.generation
+
+    def sources(self):
+        with self.lock:
+            return sorted(self.paths)
+
+    def classify(self, pdf_file, model, chunking):
+        """Return (status, file_hash) where status is "unchanged", "new" or "changed".
+
+        A file whose content is already indexed under another name (a renamed
+        or copied PDF) counts as unchanged; its name is recorded as an alias
+        of the existing entry instead of being embedded again. A file indexed
+        with another embedding model or chunk settings counts as changed.
+        """
+        pdf_name = os.path.basename(pdf_file)
+        st = os.stat(pdf_file)
+        with self.lock:
+            seen = self.paths.get(pdf_name)
+            stat_matches = seen and seen["size"] == st.st_size and seen["mtime_ns"] == st.st_mtime_ns
+
+        file_hash = seen["hash"] if stat_matches else file_sha256(pdf_file)
+        with self.lock:
+            if seen and seen["hash"].startswith("legacy:"):
+                # First hash of a PDF imported from the old processed log
+                self.files[file_hash] = self.files.pop(seen["hash"])
+                seen["hash"] = file_hash
+            entry = self.files.get(file_hash)
+            if entry and entry["model"] == model and entry.get("chunking", chunking) == chunking:
+                self.paths[pdf_name] = {"hash": file_hash, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+                return "unchanged", file_hash
+            return ("changed" if seen else "new"), file_hash
+
+    def record(self, pdf_file, file_hash, chunk_ids, pages, model, chunking):
+        """Store the result of ingesting `pdf_file` and return the chunk IDs
+        of its previous version that are no longer part of the index."""
+        pdf_name = os.path.basename(pdf_file)
+        st = os.stat(pdf_file)
+        with self.lock:
+            stale = []
+            old = self.paths.get(pdf_name)
+            if old and old["hash"] != file_hash:
+                stale = self._release(pdf_name, old["hash"])
+            previous = self.files.get(file_hash)
+            if previous:
+                # Same content indexed with other settings: its chunks are replaced
+                stale = stale + previous["chunk_ids"]
+            self.files[file_hash] = {"source": pdf_name, "chunk_ids": list(chunk_ids),
+                                     "pages": pages, "model": model, "chunking": chunking}
+            self.paths[pdf_name] = {"hash": file_hash, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            keep = set(chunk_ids)
+            stale = [chunk_id for chunk_id in stale if chunk_id not in keep]
+            self._bump(stale + list(chunk_ids) + self._moved_ids())
+            return stale
+
+    def forget(self, pdf_name):
+        """Drop `pdf_name` and return the chunk IDs that should be deleted."""
+        with self.lock:
+            old = self.paths.pop(pdf_name, None)
+            if old is None:
+                return []
+            released = self._release(pdf_name, old["hash"])
+            self._bump(released + self._moved_ids())
+            return released
+
+    def take_moved_sources(self):
+        """(source, chunk IDs) pairs whose chunks must have their "source"
+        metadata rewritten, collected since the last call."""
+        with self.lock:
+            moved, self.moved_sources = self.moved_sources, []
+            return moved
+
+    def _moved_ids(self):
+        return [chunk_id for _, ids in self.moved_sources for chunk_id in ids]
+
+    def _release(self, pdf_name, file_hash):
+        # Chunks stay while another name still points at the same content;
+        # if they were cited under `pdf_name`, they move to that alias
+        aliases = sorted(name for name, p in self.paths.items() if name != pdf_name and p["hash"] == file_hash)
+        entry = self.files.get(file_hash)
+        if aliases:
+            if entry and entry["source"] == pdf_name:
+                entry["source"] = aliases[0]
+                self.moved_sources.append((aliases[0], list(entry["chunk_ids"])))
+            return []
+        entry = self.files.pop(file_hash, None)
+        return entry["chunk_ids"] if entry else []
+
+    def adopt_legacy_log(self, log_file_path, vectorstore, model, chunking):
+        """One-time import of the old `<collection>_processed_pdfs.txt` log.
+
+        PDFs listed there are already in Chroma under their basename, so
+        their chunk IDs are looked up by source instead of re-embedding them.
+        A name with no chunks in Chroma (a run that crashed between logging
+        it and writing them) is left out and gets ingested again.
+        """
+        legacy = read_legacy_log(log_file_path)
+        with self.lock:
+            missing = [name for name in legacy if name not in self.paths]
+        adopted = 0
+        for pdf_name in missing:
+            ids = vectorstore.get(where={"source": pdf_name}, include=[])["ids"]
+            if not ids:
+                continue
+            adopted += 1
+            with self.lock:
+                self.paths[pdf_name] = {"hash": f"legacy:{pdf_name}", "size": -1, "mtime_ns": -1}
+                self.files[f"legacy:{pdf_name}"] = {"source": pdf_name, "chunk_ids": ids,
+                                                    "pages": None, "model": model, "chunking": chunking}
+        if adopted:
+            print(f"Imported {adopted} PDFs from {os.path.basename(log_file_path)}")
+            self.save()
+        if adopted < len(missing):
+            print(f"{len(missing) - adopted} PDFs in {os.path.basename(log_file_path)} have no chunks "
+                  f"and will be ingested again")
+
+
+def checkpoint_path(output_folder_path, collection_name):
+    return os.path.join(output_folder_path, f"{collection_name}_checkpoint.json")
+
+
+class IngestCheckpoint:
+    """Progress of PDFs whose ingestion has started but is not yet committed.
+
+    Each entry moves through the states "parsing" (pages are being read;
+    completed parses live in the page store), "chunked" (page and chunk
+    counts are known), "embedded" (every batch is in Chroma) and finally
+    "committed", at which point it is recorded in the manifest and dropped
+    from here. The indexes of batches already upserted are saved as each one
+    completes, so a restarted run skips them instead of embedding them again,
+    along with the IDs of chunks that were skipped because they fail to embed.
+    A PDF whose ingestion fails or that is removed before it is committed
+    has those batches deleted again (see pdf_utils.rollback_pdf).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+
+    def resume(self, pdf_name, file_hash, chunking, batch_size):
+        """Return the progress entry for `pdf_name`, starting a new one unless
+        the saved entry was made for the same content and batch settings."""
+        with self.lock:
+            entry = self.entries.get(pdf_name)
+            if not entry or (entry["hash"], entry["chunking"], entry["batch_size"]) != (file_hash, chunking, batch_size):
+                entry = {"hash": file_hash, "chunking": chunking, "batch_size": batch_size,
+                         "state": "parsing", "batches": [], "pages": None, "chunks": None}
+                self.entries[pdf_name] = entry
+                self.save()
+            elif entry["batches"]:
+                print(f"Resuming {pdf_name}: {len(entry['batches'])} batches already committed")
+            return dict(entry, batches=list(entry["batches"]))
+
+    def resumable(self, pdf_name, file_hash, chunking, batch_size):
+        """False when the saved entry of `pdf_name` is for other content or
+        settings, so resume() would start over and orphan its batches."""
+        with self.lock:
+            entry = self.entries.get(pdf_name)
+            return not entry or (entry["hash"], entry["chunking"], entry["batch_size"]) == (file_hash, chunking, batch_size)
+
+    def sources(self):
+        with self.lock:
+            return sorted(self.entries)
+
+    def discard(self, pdf_name):
+        """Drop the entry of `pdf_name` and return the IDs of the chunks its
+        batches upserted."""
+        with self.lock:
+            entry = self.entries.pop(pdf_name, None)
+            if entry is None:
+                return []
+            self.save()
+        size = entry["batch_size"]
+        last = entry["chunks"]
+        return [chunk_id(entry["hash"], idx) for batch in sorted(entry["batches"])
+                for idx in range(batch * size, (batch + 1) * size) if last is None or idx < last]
+
+    def update(self, pdf_name, **fields):
+        with self.lock:
+            self.entries[pdf_name].update(fields)
+            self.save()
+
+    def batch_done(self, pdf_name, index, skipped=()):
+        with self.lock:
+            entry = self.entries[pdf_name]
+            entry["batches"].append(index)
+            if skipped:
+                entry.setdefault("skipped", []).extend(skipped)
+            self.save()
+
+    def skipped(self, pdf_name):
+        with self.lock:
+            return set(self.entries[pdf_name].get("skipped", []))
+
+    def finish(self, pdf_name):
+        with self.lock:
+            self.entries.pop(pdf_name, None)
+            self.save()
@@ -0,0 +1,116 @@
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+
+_term_pattern = re.compile(r"\w+")
+
+# Terms are lowercased first, so "it" is not listed: it would drop "IT"
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i if in is me my of on or our
+the this to was we what when where which who will with you your
+""".split())
+
+
+def tokenize(text):
+    # Policy codes such as "HRP004" or "LTA" stay whole terms
+    return [term for term in _term_pattern.findall(text.lower()) if term not in STOPWORDS]
+
+
+def keyword_index_path(output_folder_path, collection_name):
+    return os.path.join(output_folder_path, f"{collection_name}_bm25.sqlite3")
+
+
+class KeywordIndex:
+    """On-disk BM25 inverted index of one collection's chunks.
+
+    Postings live in a WITHOUT ROWID table clustered by term, so scoring a
+    query reads one contiguous range per query term. Chunks are keyed by
+    their Chroma ID; ingestion indexes a PDF's chunks when it is committed
+    and deletes the ones Chroma drops.
+    """
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS chunks (chunk_id TEXT PRIMARY KEY, length INTEGER NOT NULL)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)) WITHOUT ROWID""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings(chunk_id)")
+        self.conn.commit()
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def add(self, items):
+        """Index an iterable of (chunk_id, text), replacing earlier versions."""
+        rows, postings = [], []
+        for chunk_id, text in items:
+            terms = tokenize(text)
+            rows.append((chunk_id, len(terms)))
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            postings.extend((term, chunk_id, tf) for term, tf in counts.items())
+        if not rows:
+            return
+        with self.lock:
+            self._delete([chunk_id for chunk_id, _ in rows])
+            self.conn.executemany("INSERT INTO chunks VALUES (?, ?)", rows)
+            self.conn.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+            self.conn.commit()
+
+    def delete(self, chunk_ids):
+        with self.lock:
+            self._delete(chunk_ids)
+            self.conn.commit()
+
+    def _delete(self, chunk_ids):
+        # SQLite caps the number of bound parameters, so delete in slices
+        for i in range(0, len(chunk_ids), 500):
+            part = list(chunk_ids[i:i + 500])
+            marks = ",".join("?" * len(part))
+            self.conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", part)
+            self.conn.execute(f"DELETE FROM chunks WHERE chunk_id IN ({marks})", part)
+
+    def add_from_vectorstore(self, vectorstore, chunk_ids):
+        """Index chunks already in Chroma, reading their text back from it."""
+        for i in range(0, len(chunk_ids), 500):
+            found = vectorstore.get(ids=list(chunk_ids[i:i + 500]), include=["documents"])
+            self.add(zip(found["ids"], found["documents"]))
+
+    def search(self, query, k=10):
+        """Return up to `k` (chunk_id, score) pairs, best first."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        scores = {}
+        with self.lock:
+            total, avg_length = self.conn.execute("SELECT COUNT(*), AVG(length) FROM chunks").fetchone()
+            if not total:
+                return []
+            avg_length = avg_length or 1.0
+            for term in terms:
+                rows = self.conn.execute("""
+                    SELECT p.chunk_id, p.tf, c.length FROM postings p JOIN chunks c USING (chunk_id)
+                    WHERE p.term = ?""", (term,)).fetchall()
+                if not rows:
+                    continue
+                idf = math.log(1 + (total - len(rows) + 0.5) / (len(rows) + 0.5))
+                for chunk_id, tf, length in rows:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
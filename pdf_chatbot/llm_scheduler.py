@@ -0,0 +1,183 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import metrics
+
+# Priority classes; lower runs first
+INTERACTIVE = 0
+BATCH = 1
+
+
+class AdmissionRejected(Exception):
+    """The LLM is overloaded: the wait queue is full, or the request's
+    deadline passed before a generation slot freed up."""
+
+
+class _Waiter:
+    def __init__(self, priority, loop=None):
+        self.priority = priority
+        self.loop = loop
+        self.state = "waiting"     # -> "granted" | "rejected" | "abandoned"
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self, state):
+        self.state = state
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class LLMScheduler:
+    """Admission control in front of the Ollama server.
+
+    At most `max_concurrent` generations run at once; further requests wait
+    in a priority queue of at most `max_queue` entries for up to `timeout`
+    seconds. A full queue rejects at once, except that an interactive
+    request pushes out the newest batch request. Both sync (threads) and
+    async (event loop) callers share the same slots.
+    """
+
+    def __init__(self, max_concurrent=2, max_queue=16, timeout=20.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.running = 0
+        self.queue = []            # heap of (priority, seq, waiter)
+        self.seq = itertools.count()
+
+    def _admit(self, priority, loop=None):
+        """Take a free slot (returns None) or enqueue a waiter (returns it)."""
+        with self.lock:
+            if self.running < self.max_concurrent and not self.queue:
+                self.running += 1
+                self._publish()
+                return None
+            if len(self.queue) >= self.max_queue:
+                worst = max(self.queue, key=lambda item: (item[0], item[1]))
+                if worst[0] <= priority:
+                    metrics.incr("llm.rejected.queue_full")
+                    raise AdmissionRejected("LLM queue is full")
+                self.queue.remove(worst)
+                heapq.heapify(self.queue)
+                worst[2].wake("rejected")
+                metrics.incr("llm.rejected.preempted")
+            waiter = _Waiter(priority, loop)
+            heapq.heappush(self.queue, (priority, next(self.seq), waiter))
+            self._publish()
+            return waiter
+
+    def _give_up(self, waiter, reason="deadline"):
+        """Called when a waiter stops waiting (its deadline passed or it was
+        cancelled); True if it got a slot anyway, which it must release."""
+        with self.lock:
+            if waiter.state == "granted":
+                return True
+            if waiter.state == "waiting":
+                waiter.state = "abandoned"
+                self.queue = [item for item in self.queue if item[2] is not waiter]
+                heapq.heapify(self.queue)
+                self._publish()
+                metrics.incr(f"llm.rejected.{reason}")
+            return False
+
+    def release(self):
+        with self.lock:
+            if self.queue:
+                # hand the slot straight to the next waiter
+                _, _, waiter = heapq.heappop(self.queue)
+                waiter.wake("granted")
+            else:
+                self.running -= 1
+            self._publish()
+
+    def _publish(self):
+        metrics.set_gauge("llm.queue_depth", len(self.queue))
+        metrics.set_gauge("llm.running", self.running)
+
+    def _admitted(self, waiter, started):
+        if waiter is not None and waiter.state == "rejected":
+            raise AdmissionRejected("Pushed out of the LLM queue by interactive requests")
+        metrics.incr("llm.admitted")
+        metrics.observe("llm.queue_wait", time.perf_counter() - started)
+
+    @contextmanager
+    def slot(self, priority=INTERACTIVE, timeout=None):
+        """Hold one generation slot for the duration of the block."""
+        started = time.perf_counter()
+        waiter = self._admit(priority)
+        if waiter is not None:
+            try:
+                granted = waiter.event.wait(self.timeout if timeout is None else timeout)
+            except BaseException:
+                if self._give_up(waiter, "cancelled"):
+                    self.release()
+                raise
+            if not granted and not self._give_up(waiter):
+                raise AdmissionRejected("Timed out waiting for the LLM")
+        self._admitted(waiter, started)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, priority=INTERACTIVE, timeout=None):
+        started = time.perf_counter()
+        waiter = self._admit(priority, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.timeout if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                if not self._give_up(waiter):
+                    raise AdmissionRejected("Timed out waiting for the LLM")
+            except BaseException:
+                # cancelled: leave the queue, or hand back a slot granted meanwhile
+                if self._give_up(waiter, "cancelled"):
+                    self.release()
+                raise
+        self._admitted(waiter, started)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class ScheduledLLM:
+    """An LLM whose generations go through an LLMScheduler slot.
+
+    Streams hold their slot until they are exhausted or closed.
+    """
+
+    def __init__(self, llm, scheduler, priority=INTERACTIVE):
+        self.llm = llm
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def invoke(self, prompt, **kwargs):
+        with self.scheduler.slot(self.priority):
+            return self.llm.invoke(prompt, **kwargs)
+
+    def predict(self, prompt):
+        return self.invoke(prompt)
+
+    async def ainvoke(self, prompt, **kwargs):
+        async with self.scheduler.aslot(self.priority):
+            return await self.llm.ainvoke(prompt, **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        with self.scheduler.slot(self.priority):
+            yield from self.llm.stream(prompt, **kwargs)
+
+    async def astream(self, prompt, **kwargs):
+        async with self.scheduler.aslot(self.priority):
+            async for chunk in self.llm.astream(prompt, **kwargs):
+                yield chunk
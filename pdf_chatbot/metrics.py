@@ -0,0 +1,32 @@
+import threading
+
+# Process-wide counters, gauges and timings of the query path. Everything
+# here is cheap enough to update on every request; snapshot() is what the
+# app shows and what a scraper would read.
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timings = {}
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def set_gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, seconds):
+    with _lock:
+        count, total, peak = _timings.get(name, (0, 0.0, 0.0))
+        _timings[name] = (count + 1, total + seconds, max(peak, seconds))
+
+
+def snapshot():
+    with _lock:
+        timings = {name: {"count": count, "avg": total / count, "max": peak}
+                   for name, (count, total, peak) in _timings.items()}
+        return {"counters": dict(_counters), "gauges": dict(_gauges), "timings": timings}
@@ -0,0 +1,411 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+# Deleted rows stay in the matrix (masked out) until there are more of them
+# than live rows, and at least this many; then the matrix is rewritten.
+compact_min_dead = 1024
+
+
+def normalize_rows(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact vector store for small and medium collections.
+
+    Vectors are normalized on insert and kept in one memory-mapped float32
+    matrix, so a query is a single matrix-vector product and an argpartition
+    for the top k: no index to build and recall is exact. Chunk text and
+    metadata live in a SQLite side table; metadata is also kept in memory,
+    one column per field on demand, for vectorized `filter`s (Chroma's where
+    syntax: equality, $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte, $and/$or).
+
+    The matrix is append-only. Replacing or deleting a chunk only masks its
+    row, and compaction writes a new matrix file, so an app process that has
+    the store open never sees a row change under it: it keeps searching its
+    snapshot until resources reopens the collection. Meant for one writer
+    (ingestion) per collection at a time.
+
+    Scores are squared L2 distances between normalized vectors (2 - 2 cos),
+    like Chroma's default space, so the relevance scores match.
+    """
+
+    def __init__(self, collection_name, embedding_function=None, persist_directory="."):
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.folder = os.path.join(persist_directory, "numpy")
+        os.makedirs(self.folder, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.store_path(persist_directory, collection_name),
+                                    check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS store (
+                dim INTEGER NOT NULL,
+                matrix TEXT NOT NULL,
+                next_row INTEGER NOT NULL)""")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL,
+                document TEXT NOT NULL,
+                metadata TEXT NOT NULL)""")
+        self.conn.commit()
+        self._load()
+
+    @staticmethod
+    def store_path(persist_directory, collection_name):
+        return os.path.join(persist_directory, "numpy", f"{collection_name}.sqlite3")
+
+    def close(self):
+        """Flush everything into the SQLite file itself (no WAL left) and close."""
+        with self.lock:
+            if self.matrix is not None:
+                self.matrix.flush()
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.conn.close()
+
+    # ------------------------------------------------------------------
+    # storage
+
+    def _matrix_path(self, name):
+        return os.path.join(self.folder, name)
+
+    def _map(self, name, capacity):
+        path = self._matrix_path(name)
+        with open(path, "ab") as f:
+            if f.tell() < capacity * self.dim * 4:
+                f.truncate(capacity * self.dim * 4)
+        capacity = os.path.getsize(path) // (self.dim * 4)
+        return np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+
+    def _load(self):
+        self.dim = None
+        self.matrix = None
+        self.matrix_name = None
+        self.next_row = 0
+        self.rows = {}             # id -> row
+        self.row_ids = []          # row -> id, None once deleted
+        self.metadatas = []        # row -> metadata, None once deleted
+        self.alive = np.zeros(0, dtype=bool)
+        self.columns = {}          # metadata field -> object array, for filters
+        found = self.conn.execute("SELECT dim, matrix, next_row FROM store").fetchone()
+        if found is None:
+            return
+        self.dim, self.matrix_name, self.next_row = found
+        self.matrix = self._map(self.matrix_name, max(self.next_row, 1))
+        self.row_ids = [None] * self.next_row
+        self.metadatas = [None] * self.next_row
+        self.alive = np.zeros(self.matrix.shape[0], dtype=bool)
+        for chunk_id, row, metadata in self.conn.execute("SELECT id, row, metadata FROM chunks"):
+            self.rows[chunk_id] = row
+            self.row_ids[row] = chunk_id
+            self.metadatas[row] = json.loads(metadata)
+            self.alive[row] = True
+
+    def _create(self, dim):
+        self.dim = dim
+        self.matrix_name = f"{self.collection_name}-{time.time_ns()}.f32"
+        self.matrix = self._map(self.matrix_name, 1024)
+        self.alive = np.zeros(self.matrix.shape[0], dtype=bool)
+        self.conn.execute("INSERT INTO store VALUES (?, ?, 0)", (dim, self.matrix_name))
+        self.conn.commit()
+
+    def _reserve(self, needed):
+        capacity = self.matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self.matrix.flush()
+        self.matrix = self._map(self.matrix_name, capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self.next_row] = self.alive[:self.next_row]
+        self.alive = alive
+
+    def _kill(self, row):
+        del self.rows[self.row_ids[row]]
+        self.row_ids[row] = None
+        self.metadatas[row] = None
+        self.alive[row] = False
+
+    def count(self):
+        return len(self.rows)
+
+    # ------------------------------------------------------------------
+    # writes
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        if not texts:
+            return []
+        vectors = self.embedding_function.embed_documents(texts)
+        self.add_vectors(ids, vectors, texts, metadatas)
+        return ids
+
+    def add_vectors(self, ids, vectors, texts, metadatas):
+        """Upsert chunks whose embeddings are already computed."""
+        if len(set(ids)) != len(ids):
+            raise ValueError("Chunk IDs within one batch must be unique")
+        vectors = normalize_rows(vectors)
+        with self.lock:
+            if self.dim is None:
+                self._create(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match "
+                                 f"{self.collection_name} ({self.dim})")
+            start = self.next_row
+            end = start + len(ids)
+            self._reserve(end)
+            # vectors reach the file before the rows pointing at them commit
+            self.matrix[start:end] = vectors
+            self.matrix.flush()
+            self.conn.executemany("INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)",
+                                  [(chunk_id, start + i, text, json.dumps(metadata or {}))
+                                   for i, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas))])
+            self.conn.execute("UPDATE store SET next_row = ?", (end,))
+            self.conn.commit()
+            for chunk_id in ids:
+                if chunk_id in self.rows:
+                    self._kill(self.rows[chunk_id])
+            for i, (chunk_id, metadata) in enumerate(zip(ids, metadatas)):
+                self.rows[chunk_id] = start + i
+                self.row_ids.append(chunk_id)
+                self.metadatas.append(dict(metadata or {}))
+            self.alive[start:end] = True
+            self.next_row = end
+            self.columns = {}
+            self._maybe_compact()
+
+    def update_metadata(self, ids, fields):
+        """Merge `fields` into the metadata of the chunks `ids`, keeping their vectors."""
+        with self.lock:
+            rows = [(chunk_id, self.rows[chunk_id]) for chunk_id in ids if chunk_id in self.rows]
+            for chunk_id, row in rows:
+                self.metadatas[row] = dict(self.metadatas[row], **fields)
+            self.conn.executemany("UPDATE chunks SET metadata = ? WHERE id = ?",
+                                  [(json.dumps(self.metadatas[row]), chunk_id) for chunk_id, row in rows])
+            self.conn.commit()
+            self.columns = {}
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return
+        with self.lock:
+            rows = [self.rows[chunk_id] for chunk_id in ids if chunk_id in self.rows]
+            if not rows:
+                return
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(self.row_ids[row],) for row in rows])
+            self.conn.commit()
+            for row in rows:
+                self._kill(row)
+            self.columns = {}
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        dead = self.next_row - len(self.rows)
+        if dead > max(compact_min_dead, len(self.rows)):
+            self._compact()
+
+    def _compact(self):
+        live = np.flatnonzero(self.alive[:self.next_row])
+        old_name = self.matrix_name
+        self.matrix_name = f"{self.collection_name}-{time.time_ns()}.f32"
+        matrix = self._map(self.matrix_name, max(2 * len(live), 1024))
+        matrix[:len(live)] = self.matrix[live]
+        matrix.flush()
+        self.conn.executemany("UPDATE chunks SET row = ? WHERE id = ?",
+                              [(new_row, self.row_ids[row]) for new_row, row in enumerate(live)])
+        self.conn.execute("UPDATE store SET matrix = ?, next_row = ?", (self.matrix_name, len(live)))
+        self.conn.commit()
+        # open readers keep their mapping of the old file; the old file may
+        # carry another prefix when the store was imported under a staging name
+        stale = set(glob.glob(self._matrix_path(f"{glob.escape(self.collection_name)}-*.f32")))
+        stale.add(self._matrix_path(old_name))
+        for path in stale:
+            if os.path.basename(path) != self.matrix_name and os.path.exists(path):
+                os.remove(path)
+        print(f"Compacted {self.collection_name}: dropped {self.next_row - len(live)} deleted rows")
+        self.matrix = matrix
+        self.row_ids = [self.row_ids[row] for row in live]
+        self.metadatas = [self.metadatas[row] for row in live]
+        self.rows = {chunk_id: row for row, chunk_id in enumerate(self.row_ids)}
+        self.alive = np.zeros(matrix.shape[0], dtype=bool)
+        self.alive[:len(live)] = True
+        self.next_row = len(live)
+
+    # ------------------------------------------------------------------
+    # filters
+
+    def _column(self, field, n):
+        column = self.columns.get(field)
+        if column is None or len(column) < n:
+            column = np.empty(len(self.metadatas), dtype=object)
+            column[:] = [metadata.get(field) if metadata else None for metadata in self.metadatas]
+            self.columns[field] = column
+        return column[:n]
+
+    def _mask(self, where, n):
+        mask = np.ones(n, dtype=bool)
+        for field, condition in where.items():
+            if field == "$and":
+                for part in condition:
+                    mask &= self._mask(part, n)
+            elif field == "$or":
+                either = np.zeros(n, dtype=bool)
+                for part in condition:
+                    either |= self._mask(part, n)
+                mask &= either
+            else:
+                mask &= self._match(self._column(field, n), condition)
+        return mask
+
+    @staticmethod
+    def _match(column, condition):
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        mask = np.ones(len(column), dtype=bool)
+        for op, value in condition.items():
+            if op == "$eq":
+                matched = column == value
+            elif op == "$ne":
+                matched = column != value
+            else:
+                test = {
+                    "$in": lambda v: v in value,
+                    "$nin": lambda v: v not in value,
+                    "$gt": lambda v: v is not None and v > value,
+                    "$gte": lambda v: v is not None and v >= value,
+                    "$lt": lambda v: v is not None and v < value,
+                    "$lte": lambda v: v is not None and v <= value,
+                }.get(op)
+                if test is None:
+                    raise ValueError(f"Unsupported filter operator {op}")
+                matched = np.frompyfunc(test, 1, 1)(column) if len(column) else mask
+            mask &= np.asarray(matched, dtype=bool)
+        return mask
+
+    # ------------------------------------------------------------------
+    # reads
+
+    def _top_k(self, embedding, k, filter=None):
+        """[(chunk_id, cosine)] of the `k` nearest live rows, best first."""
+        with self.lock:
+            if self.dim is None or not self.rows:
+                return []
+            matrix, row_ids, n = self.matrix, self.row_ids, self.next_row
+            mask = self.alive[:n].copy()
+            if filter:
+                mask &= self._mask(filter, n)
+        query = normalize_rows(embedding)[0]
+        if filter:
+            # only the rows passing the filter are scored
+            rows = np.flatnonzero(mask)
+            scores = matrix[rows] @ query
+        else:
+            rows = None
+            scores = matrix[:n] @ query
+            scores[~mask] = -np.inf
+        count = min(k, len(scores) if filter else int(mask.sum()))
+        if count <= 0:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top])]
+        return [(row_ids[rows[i] if filter else i], float(scores[i])) for i in top]
+
+    def _fetch(self, ids, columns="document, metadata"):
+        found = {}
+        with self.lock:
+            for i in range(0, len(ids), 500):
+                part = list(ids[i:i + 500])
+                marks = ",".join("?" * len(part))
+                for chunk_id, *values in self.conn.execute(
+                        f"SELECT id, {columns} FROM chunks WHERE id IN ({marks})", part):
+                    found[chunk_id] = values
+        return found
+
+    def _documents(self, ids):
+        found = self._fetch(ids)
+        return {chunk_id: Document(id=chunk_id, page_content=document, metadata=json.loads(metadata))
+                for chunk_id, (document, metadata) in found.items()}
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, filter=None, **kwargs):
+        """[(doc, distance)], nearest first; see _select_relevance_score_fn."""
+        hits = [(chunk_id, cosine) for chunk_id, cosine in self._top_k(embedding, k, filter) if chunk_id]
+        docs = self._documents([chunk_id for chunk_id, _ in hits])
+        # a writer may have deleted a hit since the search
+        return [(docs[chunk_id], 2.0 - 2.0 * cosine) for chunk_id, cosine in hits if chunk_id in docs]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        embedding = self.embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def get_by_ids(self, ids):
+        docs = self._documents(list(ids))
+        return [docs[chunk_id] for chunk_id in ids if chunk_id in docs]
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas"), **kwargs):
+        """Chroma-style get: {"ids", "documents", "metadatas", "embeddings"},
+        with the fields not in `include` set to None."""
+        with self.lock:
+            if where:
+                mask = self._mask(where, self.next_row) & self.alive[:self.next_row]
+                selected = [self.row_ids[row] for row in np.flatnonzero(mask)]
+                if ids is not None:
+                    wanted = set(ids)
+                    selected = [chunk_id for chunk_id in selected if chunk_id in wanted]
+            elif ids is not None:
+                selected = [chunk_id for chunk_id in ids if chunk_id in self.rows]
+            else:
+                selected = [chunk_id for chunk_id in self.row_ids if chunk_id is not None]
+        selected = selected[offset or 0:]
+        if limit is not None:
+            selected = selected[:limit]
+        result = {"ids": selected, "documents": None, "metadatas": None, "embeddings": None}
+        if "documents" in include or "metadatas" in include:
+            found = self._fetch(selected)
+            selected = result["ids"] = [chunk_id for chunk_id in selected if chunk_id in found]
+            if "documents" in include:
+                result["documents"] = [found[chunk_id][0] for chunk_id in selected]
+            if "metadatas" in include:
+                result["metadatas"] = [json.loads(found[chunk_id][1]) for chunk_id in selected]
+        if "embeddings" in include:
+            with self.lock:
+                rows = [self.rows[chunk_id] for chunk_id in selected]
+                result["embeddings"] = np.array(self.matrix[rows]) if rows else np.zeros((0, self.dim or 0))
+        return result
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, collection_name="langchain",
+                   persist_directory=".", **kwargs):
+        store = cls(collection_name, embedding, persist_directory)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
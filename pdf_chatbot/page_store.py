@@ -0,0 +1,53 @@
+import gzip
+import json
+import os
+import threading
+
+from langchain_core.documents import Document
+
+
+class PageStore:
+    """Extracted page text and metadata, one gzipped JSONL file per PDF content hash.
+
+    Parsing with pypdf is the slowest part of ingestion, so once a PDF has
+    been parsed its pages are kept here and re-chunking or re-embedding with
+    other settings reads them back instead of opening the PDF again. Files
+    are keyed by content hash, so the same PDF in several collections is
+    parsed only once.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, file_hash):
+        return os.path.join(self.folder, f"{file_hash}.jsonl.gz")
+
+    def has(self, file_hash):
+        return os.path.exists(self.path(file_hash))
+
+    def iter_pages(self, file_hash):
+        with gzip.open(self.path(file_hash), "rt", encoding="utf-8") as f:
+            for line in f:
+                page = json.loads(line)
+                yield Document(page_content=page["text"], metadata=page["metadata"])
+
+    def record(self, file_hash, pages):
+        """Yield `pages` unchanged while writing them to the store.
+
+        The file only appears under its final name once every page has been
+        written, so a parse that fails halfway never leaves a truncated entry.
+        """
+        final_path = self.path(file_hash)
+        tmp_path = f"{final_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        complete = False
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+                for page in pages:
+                    f.write(json.dumps({"text": page.page_content, "metadata": page.metadata}, default=str) + "\n")
+                    yield page
+            os.replace(tmp_path, final_path)
+            complete = True
+        finally:
+            if not complete and os.path.exists(tmp_path):
+                os.remove(tmp_path)
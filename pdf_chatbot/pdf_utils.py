@@ -1,10 +1,16 @@
 
+import contextlib
+import itertools
 import os
 import sys 
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from langchain_community.document_loaders import PyPDFLoader
+import pypdf
+from langchain_community.document_loaders.parsers.pdf import _purge_metadata
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_ollama import OllamaEmbeddings
 from langchain_core.documents import Document
@@ -14,95 +20,543 @@ from langchain_ollama.llms import OllamaLLM
 from langchain.prompts import PromptTemplate
 
 
-from vectordb import get_vectorstore,pdf_file_path
+from vectordb import get_vectorstore,pdf_file_path,set_source
+from ingest_manifest import IngestCheckpoint, IngestManifest, checkpoint_path, chunk_id, manifest_path
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from embedding_client import BatchEmbedder, EmbeddingBatchError
+from page_store import PageStore
+from context_packer import estimate_tokens
+from keyword_index import KeywordIndex, keyword_index_path
 
 
 model_embedding ="nomic-embed-text:latest"
 model_llm = 'llama3.2:3b'
-collection_name= os.path.basename(pdf_file_path).lower()
+# How long Ollama keeps the LLM loaded after a request. While it stays
+# resident, its KV cache of the static prompt prefix is reused across requests.
+llm_keep_alive = "30m"
+llm_num_ctx = 4096
+# Prompt tokens held back for the answer; the retrieved context gets what is
+# left of the window, or context_token_budget if that is smaller
+answer_token_reserve = 768
+context_token_budget = None
+default_collection_name = os.path.basename(pdf_file_path).lower()
 persist_directory = os.path.join('.', 'chroma_db')  # Change this to your desired path
+embedding_cache_path = os.path.join('.', 'embedding_cache.sqlite3')  # Shared by every collection
+chunk_size = 1000
+chunk_overlap = 200
+# Changing either chunk setting re-chunks every PDF on the next run, from the
+# cached page text rather than by parsing the PDFs again.
+chunking = f"{chunk_size}/{chunk_overlap}"
 
 
-def get_pdf_text_emd(pdf_path, log_file="processed_pdfs.txt", output_folder="extracted_texts"):
+def get_ingest_embeddings():
+    # Chunks already embedded for any collection are served from the shared cache
+    return CachedEmbeddings(OllamaEmbeddings(model=model_embedding),
+                            EmbeddingCache(embedding_cache_path), model_embedding)
 
-    log_file = f'{collection_name}_{log_file}'
+
+def get_text_splitter():
+    return RecursiveCharacterTextSplitter(
+                        chunk_size=chunk_size,
+                        chunk_overlap=chunk_overlap,
+                        separators=["\n\n", "\n", ".", "?", "!", " ", ""],
+                        length_function=len)
+
+
+def load_pdf_pages(pdf_file):
+    """Yield the pages of a PDF as PyPDFLoader(pdf_file).lazy_load() does.
+
+    PyPDFLoader keeps every object pypdf resolved, content streams included,
+    until the last page, and rebuilds the label list of every page for each
+    one, so its memory and time grow with the page count. Here the labels
+    are read once and pypdf's object cache is dropped after each page.
+    """
+    with open(pdf_file, "rb") as f:
+        reader = pypdf.PdfReader(f)
+        doc_metadata = _purge_metadata({"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+                                       | dict(reader.metadata or {})
+                                       | {"source": pdf_file, "total_pages": len(reader.pages)})
+        labels = reader.page_labels
+        for page_number, page in enumerate(reader.pages):
+            text = page.extract_text(extraction_mode="plain").strip()
+            reader.resolved_objects.clear()
+            yield Document(page_content=text,
+                           metadata=doc_metadata | {"page": page_number, "page_label": labels[page_number]})
+
+
+def iter_pdf_pages(pdf_file, file_hash=None, page_store=None):
+    """Yield the pages of a PDF, from `page_store` when it was parsed before.
+
+    Freshly parsed pages are written to the store as they go by.
+    """
+    if page_store is not None and file_hash is not None:
+        if page_store.has(file_hash):
+            yield from page_store.iter_pages(file_hash)
+            return
+        yield from page_store.record(file_hash, load_pdf_pages(pdf_file))
+        return
+    yield from load_pdf_pages(pdf_file)
+
+
+def iter_pdf_chunks(pdf_file, counts=None, file_hash=None, page_store=None):
+    """Yield (text, metadata) chunks of a PDF one page at a time.
+
+    Only the current page is held in memory. Chunks never span pages, so the
+    result is the same as splitting the fully loaded document.
+    """
+    text_splitter = get_text_splitter()
+    for page in iter_pdf_pages(pdf_file, file_hash, page_store):
+        if counts is not None:
+            counts["pages"] += 1
+        for chunk in text_splitter.split_documents([page]):
+            yield chunk.page_content, chunk.metadata
+
+
+def load_and_split(pdf_file, file_hash=None, page_store=None):
+    """Parse and chunk one PDF.
+
+    Runs inside the parse process pool in parallel mode, so it only returns
+    picklable values: the page count and a list of (text, metadata) pairs.
+    """
+    counts = {"pages": 0}
+    chunks = list(iter_pdf_chunks(pdf_file, counts, file_hash, page_store))
+    return counts["pages"], chunks
+
+
+def iter_chunk_documents(pdf_name, file_hash, chunks):
+    for idx, (text, metadata) in enumerate(chunks):
+        metadata['source'] = pdf_name
+        metadata['tokens'] = estimate_tokens(text)  # for context packing at query time
+        yield Document(page_content=text, metadata=metadata), chunk_id(file_hash, idx)
+
+
+def add_chunks_to_vectorstore(embedder, pdf_name, file_hash, chunks, skip_batches=(), on_batch=None):
+    # Add the chunks to the vector store, one embedding batch at a time.
+    # `chunks` may be a generator, in which case nothing beyond the batches
+    # currently being embedded is kept in memory.
+    return embedder.add_stream(iter_chunk_documents(pdf_name, file_hash, chunks), skip_batches, on_batch)
+
+
+def commit_pdf(manifest, vectorstore, pdf_file, file_hash, ids, pages, keyword_index=None):
+    """Record an ingested PDF and drop chunks left over from its previous version."""
+    stale_ids = manifest.record(pdf_file, file_hash, ids, pages, model_embedding, chunking)
+    if stale_ids:
+        vectorstore.delete(ids=stale_ids)
+    apply_moved_sources(manifest, vectorstore)
+    if keyword_index is not None:
+        # BM25 postings follow exactly what Chroma holds for the PDF
+        keyword_index.delete(stale_ids)
+        keyword_index.add_from_vectorstore(vectorstore, ids)
+    manifest.save()
+
+
+def apply_moved_sources(manifest, vectorstore):
+    # Chunks of content whose cited PDF name is gone or now holds other
+    # content, while an alias of the old content remains: cite the alias
+    for source, ids in manifest.take_moved_sources():
+        set_source(vectorstore, ids, source)
+        print(f"{len(ids)} chunks now cite {source}")
+
+
+def rollback_pdf(manifest, checkpoint, vectorstore, pdf_name):
+    """Delete the chunks an uncommitted ingestion of `pdf_name` upserted, so
+    half of a PDF is never searchable, and drop its checkpoint entry."""
+    ids = checkpoint.discard(pdf_name)
+    with manifest.lock:
+        # The same content may be committed under another name meanwhile
+        committed = {chunk_id for entry in manifest.files.values() for chunk_id in entry["chunk_ids"]}
+    ids = [chunk_id for chunk_id in ids if chunk_id not in committed]
+    if ids:
+        vectorstore.delete(ids=ids)
+    return ids
+
+
+def embed_and_commit(embedder, manifest, checkpoint, pdf_file, file_hash, chunks, counts, keyword_index=None):
+    """Embed the chunks of one PDF, checkpointing every batch, then commit it.
+
+    `counts["pages"]` must be final once `chunks` is exhausted. Batches an
+    interrupted run already upserted are skipped, so a resumed PDF only
+    costs parsing (usually from the page store) for those batches. If the
+    PDF fails, the batches it upserted are rolled back; their vectors stay
+    in the embedding cache, so the next attempt does not embed them again.
+    """
+    pdf_name = os.path.basename(pdf_file)
+    if not checkpoint.resumable(pdf_name, file_hash, chunking, embedder.batch_size):
+        # Progress on an older version of the file
+        rollback_pdf(manifest, checkpoint, embedder.vectorstore, pdf_name)
+    progress = checkpoint.resume(pdf_name, file_hash, chunking, embedder.batch_size)
+    if isinstance(chunks, list):
+        checkpoint.update(pdf_name, state="chunked", pages=counts["pages"], chunks=len(chunks))
+    try:
+        ids = add_chunks_to_vectorstore(embedder, pdf_name, file_hash, chunks, skip_batches=set(progress["batches"]),
+                                        on_batch=lambda index, skipped: checkpoint.batch_done(pdf_name, index, skipped))
+    except Exception:
+        rollback_pdf(manifest, checkpoint, embedder.vectorstore, pdf_name)
+        raise
+    checkpoint.update(pdf_name, state="embedded", pages=counts["pages"], chunks=len(ids))
+    # Chunks that fail to embed, in this run or an interrupted one, are left out
+    skipped = checkpoint.skipped(pdf_name)
+    ids = [chunk_id for chunk_id in ids if chunk_id not in skipped]
+    with embedder.stats.stage("commit") if embedder.stats else contextlib.nullcontext():
+        commit_pdf(manifest, embedder.vectorstore, pdf_file, file_hash, ids, counts["pages"], keyword_index)
+    checkpoint.finish(pdf_name)
+    return ids
+
+
+def commit_embedded(manifest, checkpoint, vectorstore, pdf_file, file_hash, keyword_index=None):
+    """Commit a PDF whose batches were all upserted before the last run stopped.
+
+    Returns (pages, ids), or None when there is no such checkpoint.
+    """
+    pdf_name = os.path.basename(pdf_file)
+    with checkpoint.lock:
+        entry = checkpoint.entries.get(pdf_name)
+    if not entry or entry["state"] != "embedded" or (entry["hash"], entry["chunking"]) != (file_hash, chunking):
+        return None
+    skipped = set(entry.get("skipped", []))
+    ids = [chunk_id(file_hash, idx) for idx in range(entry["chunks"])]
+    ids = [chunk_id for chunk_id in ids if chunk_id not in skipped]
+    commit_pdf(manifest, vectorstore, pdf_file, file_hash, ids, entry["pages"], keyword_index)
+    checkpoint.finish(pdf_name)
+    return entry["pages"], ids
+
+
+class IngestStats:
+    """Counters and per-stage timings for one or more ingestion runs.
+
+    Stage times are summed over every worker, so with several workers they
+    can add up to more than the wall time.
+    """
+
+    def __init__(self, label="ingest"):
+        self.label = label
+        self.started = time.perf_counter()
+        self.files = 0
+        self.pages = 0
+        self.chunks = 0
+        self.bytes_done = 0
+        self.files_expected = 0
+        self.bytes_expected = 0
+        self.stage_seconds = {}
+        self.lock = threading.Lock()
+        self._stop_progress = None
+
+    def expect(self, files=0, nbytes=0):
+        with self.lock:
+            self.files_expected += files
+            self.bytes_expected += nbytes
+
+    def add(self, pages=0, chunks=0, files=0, nbytes=0):
+        with self.lock:
+            self.pages += pages
+            self.chunks += chunks
+            self.files += files
+            self.bytes_done += nbytes
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - started)
+
+    def timed_iter(self, iterable, name):
+        # Charges the time spent producing each item (not consuming it) to `name`
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add_stage(name, time.perf_counter() - started)
+                return
+            self.add_stage(name, time.perf_counter() - started)
+            yield item
+
+    def progress(self):
+        with self.lock:
+            elapsed = max(time.perf_counter() - self.started, 1e-9)
+            rate = self.bytes_done / elapsed
+            remaining = self.bytes_expected - self.bytes_done
+            eta = f"{remaining / rate:.0f}s" if rate and remaining > 0 else "-"
+            return (f"[{self.label}] {self.files}/{self.files_expected} PDFs, "
+                    f"{self.pages / elapsed:.1f} pages/sec, {self.chunks / elapsed:.1f} chunks/sec, "
+                    f"{rate / 1e6:.2f} MB/s, ETA {eta}")
+
+    def start_progress(self, interval=5.0):
+        """Print a progress line every `interval` seconds until stop_progress()."""
+        stop = self._stop_progress = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                print(self.progress(), flush=True)
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def stop_progress(self):
+        if self._stop_progress is not None:
+            self._stop_progress.set()
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        print(f"Ingested {self.files} PDFs, {self.pages} pages, {self.chunks} chunks in {elapsed:.1f}s "
+              f"({self.pages / elapsed:.1f} pages/sec, {self.chunks / elapsed:.1f} chunks/sec)")
+        if self.stage_seconds:
+            print("Stage timings: " + ", ".join(f"{name} {seconds:.1f}s"
+                                                for name, seconds in self.stage_seconds.items()))
+
+
+class IngestPools:
+    """Worker pools that several get_pdf_text_emd runs can share.
+
+    `parse_pool` (processes) parses and splits PDFs in the parallel mode,
+    `embed_pool` runs one thread per PDF being embedded, and `request_pool`
+    caps the embedding requests open against Ollama across every run.
+    """
+
+    def __init__(self, parse_workers=1, embed_workers=1, max_in_flight=4):
+        self.parse_workers = parse_workers
+        self.embed_workers = embed_workers
+        self.max_in_flight = max_in_flight
+        self.parallel = parse_workers > 1 or embed_workers > 1
+        self.parse_pool = ProcessPoolExecutor(max_workers=parse_workers) if self.parallel else None
+        self.embed_pool = ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="ingest")
+        self.request_pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed")
+
+    def close(self):
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=True)
+        self.embed_pool.shutdown(wait=True)
+        self.request_pool.shutdown(wait=True)
+
+
+def get_pdf_text_emd(pdf_path, log_file="processed_pdfs.txt", output_folder="extracted_texts",
+                     parse_workers=1, embed_workers=1, batch_size=64, max_in_flight=4,
+                     streaming=False, embeddings=None, collection_name=None, pools=None, stats=None):
+    """Parse, chunk, embed and store every new PDF under `pdf_path`.
+
+    With parse_workers/embed_workers left at 1 files are handled one after
+    another. Anything higher switches to the parallel mode: a process pool
+    parses and splits PDFs while a bounded set of embedding threads keeps
+    Ollama busy with the chunks of PDFs that are already parsed.
+
+    Chunks go to Ollama in batches of `batch_size` with at most
+    `max_in_flight` requests open at once; every batch is written to Chroma
+    as soon as its embeddings are back.
+
+    `streaming` processes one PDF at a time as page -> chunk -> embedding
+    batch -> upsert, so peak memory is bounded by the batches in flight
+    rather than by the size of the largest PDF. What still grows with the
+    page count is pypdf's page index (about 4 KB per page, built when the
+    PDF is opened) and the chunk IDs kept for the manifest; Chroma's own
+    index grows with the collection either way (benchmarks/bench_streaming.py).
+    It takes precedence over the parallel mode.
+
+    `pdf_path` may be a folder, a single PDF or a list of PDF files. Passing
+    `pools` and `stats` lets several runs share worker pools and progress
+    counters; the worker settings above are then taken from `pools`.
+    """
+    if collection_name is None:
+        collection_name = default_collection_name
 
     output_folder_path = os.path.join(os.path.abspath(os.curdir),output_folder)
     if os.path.exists(output_folder_path) == False :
         os.makedirs(output_folder_path)
 
-    # Read the log file to track already processed PDFs
-    processed_pdfs = set()
-    log_file_path = os.path.join(output_folder_path, log_file)  # Fix path issue
-
-    if os.path.exists(log_file_path):
-        with open(log_file_path, "r") as f:
-            processed_pdfs.update(f.read().splitlines())
-
     # Get list of PDF files to process
     pdf_files = []
-    if os.path.isdir(pdf_path):  # If a folder is given
+    if isinstance(pdf_path, str) and os.path.isdir(pdf_path):  # If a folder is given
         pdf_files = [os.path.join(pdf_path, f) for f in os.listdir(pdf_path) if f.endswith(".pdf")]
+    elif isinstance(pdf_path, (list, tuple)):  # If specific PDF files are given
+        pdf_files = [f for f in pdf_path if os.path.isfile(f) and f.endswith(".pdf")]
     elif os.path.isfile(pdf_path) and pdf_path.endswith(".pdf"):  # If a single PDF file is given
         pdf_files = [pdf_path]
     else:
         print(f"Invalid path: {pdf_path}")
         return None  # Return None for invalid input
 
-    
+    # One embedding client and collection handle for the whole run
+    if embeddings is None:
+        embeddings = get_ingest_embeddings()
+    vectorstore = get_vectorstore(collection_name=collection_name, embedding_function=embeddings,
+                                   persist_directory=persist_directory, allow_import=True)
 
+    # The manifest tracks PDFs by content hash; a stat() is enough to skip
+    # untouched files and only files whose stat changed are read and hashed.
+    manifest = IngestManifest(manifest_path(output_folder_path, collection_name))
+    manifest.adopt_legacy_log(os.path.join(output_folder_path, f'{collection_name}_{log_file}'),
+                              vectorstore, model_embedding, chunking)
+    page_store = PageStore(os.path.join(output_folder_path, "pages"))
+    checkpoint = IngestCheckpoint(checkpoint_path(output_folder_path, collection_name))
+    keyword_index = KeywordIndex(keyword_index_path(output_folder_path, collection_name))
+    if manifest.files and not keyword_index.count():
+        # Collection ingested before the keyword index existed
+        indexed = [chunk_id for entry in manifest.files.values() for chunk_id in entry["chunk_ids"]]
+        keyword_index.add_from_vectorstore(vectorstore, indexed)
+        print(f"Built the keyword index of {collection_name} from {len(indexed)} existing chunks")
+    own_stats = stats is None
+    if own_stats:
+        stats = IngestStats(collection_name)
+
+    pending, duplicates, pending_hashes = [], [], set()
     for pdf_file in pdf_files:
         pdf_name = os.path.basename(pdf_file)
-        
-        if pdf_name in processed_pdfs:
+        with stats.stage("hash"):
+            status, file_hash = manifest.classify(pdf_file, model_embedding, chunking)
+        if status == "unchanged":
             print(f"Skipping already processed PDF: {pdf_name}")
             continue  # Skip already processed files
+        if file_hash in pending_hashes:
+            # Identical copy of a PDF in this run; recorded as an alias afterwards
+            duplicates.append(pdf_file)
+            continue
+        committed = commit_embedded(manifest, checkpoint, vectorstore, pdf_file, file_hash, keyword_index)
+        if committed:
+            print(f"Committed {pdf_name} embedded by an interrupted run")
+            stats.add(pages=committed[0], chunks=len(committed[1]), files=1)
+            continue
+        pending_hashes.add(file_hash)
+        pending.append((pdf_file, file_hash))
+    manifest.save()
+    stats.expect(files=len(pending), nbytes=sum(os.path.getsize(pdf_file) for pdf_file, _ in pending))
 
-        print(f"Processing: {pdf_name}")
-    
+    own_pools = pools is None
+    if own_pools:
+        pools = IngestPools(parse_workers, embed_workers, max_in_flight)
+    embedder = BatchEmbedder(vectorstore, batch_size=batch_size, max_in_flight=pools.max_in_flight,
+                             pool=pools.request_pool, stats=stats)
 
-        try:
-            loader = PyPDFLoader(pdf_file) or ""  # Handle NoneType cases
-            documents = loader.load() or []
-        
-            with open(log_file_path, "a") as f:
-                f.write(pdf_name + "\n")
+    if streaming:
+        for pdf_file, file_hash in pending:
+            pdf_name = os.path.basename(pdf_file)
+            print(f"Streaming: {pdf_name}")
+            counts = {"pages": 0}
+            try:
+                chunks = stats.timed_iter(iter_pdf_chunks(pdf_file, counts, file_hash, page_store), "parse")
+                ids = embed_and_commit(embedder, manifest, checkpoint, pdf_file, file_hash, chunks, counts,
+                                       keyword_index)
+            except Exception as e:
+                print(f"Error processing {pdf_name}: {e}")
+                continue
+            stats.add(pages=counts["pages"], chunks=len(ids), files=1, nbytes=os.path.getsize(pdf_file))
+    elif pools.parallel:
+        _ingest_parallel(pending, embedder, manifest, checkpoint, page_store, stats, pools, keyword_index)
+    else:
+        for pdf_file, file_hash in pending:
+            pdf_name = os.path.basename(pdf_file)
+            print(f"Processing: {pdf_name}")
 
-        except Exception as e:
-            print(f"Error processing {pdf_name}: {e}")
+            try:
+                print("Creating Chuncks.")
+                with stats.stage("parse"):
+                    pages, chunks = load_and_split(pdf_file, file_hash, page_store)
+            except Exception as e:
+                print(f"Error processing {pdf_name}: {e}")
+                continue
 
-        print("Creating Chuncks.")
-        text_splitter = RecursiveCharacterTextSplitter(
-                        chunk_size=1000,
-                        chunk_overlap=200,
-                        separators=["\n\n", "\n", ".", "?", "!", " ", ""],
-                        length_function=len)
-        # Split the text into chunks
-        chunks = text_splitter.split_documents(documents)
-
-        print("Creating embeddings .")
-        # Create embeddings
-        embeddings = OllamaEmbeddings(model=model_embedding)
-        # Create a Chroma vector store
-        vectorstore = get_vectorstore(collection_name=collection_name, embedding_function=embeddings, 
-                                       persist_directory=persist_directory) 
-        # Add the chunks to the vector store
-        documents,ids = [], [] 
-        for idx, split in enumerate(chunks):
-            split.metadata['source'] = pdf_name
-            document = Document(
-            page_content=split.page_content,
-            metadata=split.metadata)
-
-            documents.append(document)
-            ids.append(f"{split.metadata['source']}_{idx}")
-        # Add documents to the vector store
-        print("Adding documents to vectorstore.")
-        vectorstore.add_documents(documents, ids=ids)
-    
+            print("Adding documents to vectorstore.")
+            try:
+                ids = embed_and_commit(embedder, manifest, checkpoint, pdf_file, file_hash, chunks,
+                                       {"pages": pages}, keyword_index)
+            except EmbeddingBatchError as e:
+                print(f"Error embedding {pdf_name}: {e}")
+                continue
+            stats.add(pages=pages, chunks=len(ids), files=1, nbytes=os.path.getsize(pdf_file))
 
+    if own_pools:
+        pools.close()
+    for pdf_file in duplicates:
+        manifest.classify(pdf_file, model_embedding, chunking)
+    manifest.save()
+    embedder.report()
+    if own_stats:
+        stats.report()
+        if isinstance(embeddings, CachedEmbeddings):
+            print(f"Embedding cache: {embeddings.hits} hits, {embeddings.misses} misses")
     print("PDF processing and  completed.")
-    return 
+    return
+
+
+def remove_pdfs(pdf_names, collection_name=None, output_folder="extracted_texts"):
+    """Delete the chunks of PDFs that were removed from a collection's folder."""
+    if collection_name is None:
+        collection_name = default_collection_name
+    output_folder_path = os.path.join(os.path.abspath(os.curdir), output_folder)
+    manifest = IngestManifest(manifest_path(output_folder_path, collection_name))
+    vectorstore = get_vectorstore(collection_name=collection_name, embedding_function=None,
+                                  persist_directory=persist_directory, allow_import=True)
+    checkpoint = IngestCheckpoint(checkpoint_path(output_folder_path, collection_name))
+    keyword_index = KeywordIndex(keyword_index_path(output_folder_path, collection_name))
+    for pdf_name in pdf_names:
+        ids = manifest.forget(os.path.basename(pdf_name))
+        if ids:
+            vectorstore.delete(ids=ids)
+            keyword_index.delete(ids)
+        apply_moved_sources(manifest, vectorstore)
+        # Batches of an ingestion that never got committed
+        ids += rollback_pdf(manifest, checkpoint, vectorstore, os.path.basename(pdf_name))
+        print(f"Removed {len(ids)} chunks of {os.path.basename(pdf_name)} from {collection_name}")
+    manifest.save()
+
+
+def timed_load_and_split(pdf_file, file_hash=None, page_store=None):
+    # Parse pool entry point: also returns the seconds spent in the worker
+    started = time.perf_counter()
+    pages, chunks = load_and_split(pdf_file, file_hash, page_store)
+    return time.perf_counter() - started, pages, chunks
+
+
+def _ingest_parallel(pending, embedder, manifest, checkpoint, page_store, stats, pools, keyword_index=None):
+    # Parsed PDFs waiting for an embedding worker are capped at two per
+    # worker, and new PDFs are only handed to the parse pool when a slot frees
+    # up, so a slow embedding server never lets parsed chunks pile up in memory.
+    embed_slots = threading.BoundedSemaphore(pools.embed_workers * 2)
+
+    def embed(pdf_file, file_hash, pages, chunks):
+        pdf_name = os.path.basename(pdf_file)
+        try:
+            ids = embed_and_commit(embedder, manifest, checkpoint, pdf_file, file_hash, chunks, {"pages": pages},
+                                   keyword_index)
+            stats.add(pages=pages, chunks=len(ids), files=1, nbytes=os.path.getsize(pdf_file))
+            print(f"Added {len(ids)} chunks from {pdf_name}")
+        except Exception as e:
+            print(f"Error embedding {pdf_name}: {e}")
+        finally:
+            embed_slots.release()
+
+    def submit_parse(pdf_file, file_hash):
+        future = pools.parse_pool.submit(timed_load_and_split, pdf_file, file_hash, page_store)
+        parsing[future] = (pdf_file, file_hash)
+
+    pending_iter = iter(pending)
+    parsing = {}
+    embedding = []
+    for pdf_file, file_hash in itertools.islice(pending_iter, pools.parse_workers):
+        submit_parse(pdf_file, file_hash)
+
+    while parsing:
+        done, _ = wait(parsing, return_when=FIRST_COMPLETED)
+        for future in done:
+            pdf_file, file_hash = parsing.pop(future)
+            pdf_name = os.path.basename(pdf_file)
+            try:
+                seconds, pages, chunks = future.result()
+            except Exception as e:
+                print(f"Error processing {pdf_name}: {e}")
+            else:
+                stats.add_stage("parse", seconds)
+                print(f"Parsed {pdf_name}: {pages} pages, {len(chunks)} chunks")
+                embed_slots.acquire()
+                embedding.append(pools.embed_pool.submit(embed, pdf_file, file_hash, pages, chunks))
+            for pdf_file, file_hash in itertools.islice(pending_iter, 1):
+                submit_parse(pdf_file, file_hash)
+    # The pools may outlive this run, so wait for this run's PDFs explicitly
+    wait(embedding)
 
 
 def get_llm(temperature = 0.1): 
@@ -111,7 +565,8 @@ def get_llm(temperature = 0.1):
                     repeat_penalty=1.1,       # Discourage repetition
                     top_k=40,                 # Consider more token possibilities
                     top_p=0.95,               # Sample from more probable tokens
-                    num_ctx=4096)              # Larger context window for better understanding)
+                    num_ctx=llm_num_ctx,       # Larger context window for better understanding)
+                    keep_alive=llm_keep_alive) # Stay loaded so the prompt prefix cache survives
     return llm 
 
 
@@ -156,60 +611,69 @@ def get_conversation_chain(retriever, llm):
         verbose=True
     )
 
+# What the assistant says when the policies do not cover a question; app.py
+# also returns it directly when retrieval finds nothing relevant
+not_available_response = ("This information is not available in the policy documents. "
+                          "Please contact HR at hr@company.com or IT at support@company.com for assistance.")
+
+# The static part of every prompt, assembled once at import. It is
+# byte-identical for every request and comes first, so Ollama can reuse the
+# evaluated prefix instead of running these tokens through prompt eval again;
+# only the retrieved context and the query after it are new per request.
+system_prompt = f"""\
+You are a professional HR/IT policy assistant for an organization.
+
+Your primary responsibilities:
+- Answer employee queries based ONLY on the company's official HR or IT policies provided in the context
+- NEVER guess, speculate, or make up information
+- If the information isn't available in the policy documents, respond with: "{not_available_response}"
+- If the question is ambiguous, ask clarifying questions
+- Format responses in a clear, structured way
+- ALWAYS cite the specific policy section when available (e.g., "According to Section 3.2 of the Leave Policy...")
+- Maintain a helpful, professional, and concise tone
+- Do not assign any full form for abbreviations on your own, always refer to data or ask the user back for clarification.
+- Only answer for the given question and its context, even though it applies to other areas well. Always answer the asked question and do not add additional information in the question"""
+
+# Additional conditioning to help with policy interpretation
+policy_guidance = """\
+When interpreting policies:
+• Present all relevant conditions and exceptions
+• Include deadlines, limits, and eligibility criteria
+• If the policy has changed recently, note both current and previous versions if available
+• For IT policies, include any security implications"""
+
+# Example Q&A with realistic policy language and formatting
+example_qna = """\
+Example Q&A:
+
+Q: Can I access my emails while on leave?
+A: According to the IT Acceptable Use Policy:
+• Employees are not required to check or respond to emails during approved leave periods
+• For critical roles, an alternative point of contact should be provided before going on leave
+• If you must access work systems during leave, document this time as it may affect your leave balance
+
+Q: What is our policy on remote work?
+A: This information is not available in the policy documents provided. Please contact HR at hr@company.com for the latest remote work policy."""
+
+static_prompt_prefix = f"{system_prompt}\n\n{policy_guidance}\n\n{example_qna}\n\n"
+
+
 def build_prompt(user_query: str, retrieved_context: str = "") -> str:
-    system_prompt = f"""
-    You are a professional HR/IT policy assistant for an organization.
-    
-    Your primary responsibilities:
-    - Answer employee queries based ONLY on the company's official HR or IT policies provided in the context
-    - NEVER guess, speculate, or make up information
-    - If the information isn't available in the policy documents, respond with: "This information is not available in the policy documents. Please contact HR at hr@company.com or IT at support@company.com for assistance."
-    - If the question is ambiguous, ask clarifying questions
-    - Format responses in a clear, structured way
-    - ALWAYS cite the specific policy section when available (e.g., "According to Section 3.2 of the Leave Policy...")
-    - Maintain a helpful, professional, and concise tone
-    - Do not assign any full form for abbreviations on your own, always refer to data or ask the user back for clarification.
-    - Only answer for the given question and its context, even though it applies to other areas well. Always answer the asked question and do not add additional information in the question
-    """.strip()
-    
-    # Enhanced example Q&A with more realistic policy language and better formatting
-    example_qna = """
-    Example Q&A:
-    
-    Q: Can I access my emails while on leave?
-    A: According to the IT Acceptable Use Policy:
-    • Employees are not required to check or respond to emails during approved leave periods
-    • For critical roles, an alternative point of contact should be provided before going on leave
-    • If you must access work systems during leave, document this time as it may affect your leave balance
-    
-    Q: What is our policy on remote work?
-    A: This information is not available in the policy documents provided. Please contact HR at hr@company.com for the latest remote work policy.
-    """.strip()
-    
-    # Additional conditioning to help with policy interpretation
-    policy_guidance = """
-    When interpreting policies:
-    • Present all relevant conditions and exceptions
-    • Include deadlines, limits, and eligibility criteria
-    • If the policy has changed recently, note both current and previous versions if available
-    • For IT policies, include any security implications
-    """.strip()
-    
-    # Build the full prompt with better structure
-    prompt = f"""
-    {system_prompt}
-    
-    {policy_guidance}
-    
-    {example_qna}
-    
-    RELEVANT POLICY SECTIONS:
-    {retrieved_context or '[No relevant policy sections found in the knowledge base.]'}
-    
-    USER QUERY:
-    {user_query}
-    
-    RESPONSE:
-    """.strip()
-    
-    return prompt
\ No newline at end of file
+    # Everything dynamic goes after the shared prefix
+    return (f"{static_prompt_prefix}"
+            f"RELEVANT POLICY SECTIONS:\n"
+            f"{retrieved_context or '[No relevant policy sections found in the knowledge base.]'}\n\n"
+            f"USER QUERY:\n{user_query.strip()}\n\n"
+            f"RESPONSE:")
+
+
+# The static prefix plus the section labels around the context and query
+prompt_overhead_tokens = estimate_tokens(build_prompt(""))
+
+
+def context_budget(user_query):
+    """Tokens the retrieved context may use in a prompt for `user_query`."""
+    free = llm_num_ctx - answer_token_reserve - prompt_overhead_tokens - estimate_tokens(user_query)
+    # token counts are estimates; leave headroom for their error
+    budget = int(free / 1.15)
+    return min(budget, context_token_budget) if context_token_budget else budget
@@ -0,0 +1,253 @@
+import asyncio
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from langchain_ollama import OllamaEmbeddings
+
+from answer_cache import make_answer_cache
+from embedder import output_folder
+from embedding_cache import CachedEmbeddings, EmbeddingCache, QueryEmbeddingCache
+from ingest_manifest import IngestManifest, manifest_path
+from keyword_index import KeywordIndex, keyword_index_path
+from llm_scheduler import INTERACTIVE, LLMScheduler, ScheduledLLM
+from pdf_utils import embedding_cache_path, get_llm, model_embedding, persist_directory
+from retrievers import FederatedRetriever
+from singleflight import SingleFlight
+from vectordb import get_vectorstore, redis_client, vector_backend
+
+# Query embeddings: recent questions are kept in memory and, with
+# query_cache_persist, in the shared embedding cache file across restarts.
+query_cache_size = 2048
+query_cache_persist = True
+
+# Semantic answer cache: a question whose embedding is at least
+# answer_cache_threshold similar to an earlier one in the same collection
+# gets the earlier answer without calling the LLM.
+# answer_cache_backend picks where cached answers live: "sqlite" (embedded,
+# under answer_cache_path, no extra service), "redis" (vectordb.redis_client,
+# shared by every app process) or "memory" (lost on restart).
+answer_cache_backend = "sqlite"
+answer_cache_path = os.path.join('.', 'answer_cache')
+answer_cache_threshold = 0.92
+answer_cache_ttl_seconds = 24 * 3600
+# Per collection. A lookup compares the query with every entry (answer_cache.
+# AnswerIndex): roughly 0.3 ms per 1,000 entries at 768 dimensions, so ~6 ms
+# at this cap but ~30 ms at 100k. Raise it only if that latency is acceptable.
+answer_cache_max_entries = 20_000
+
+# Retrieval fuses Chroma similarity with the BM25 keyword index built at
+# ingestion; False falls back to similarity search alone
+hybrid_retrieval = True
+# Threads searching collections in parallel, shared by all sessions
+search_workers = 8
+
+# LLM admission control: generations running at once against Ollama, how
+# many more may wait, and for how long before they are turned away
+llm_max_concurrent = 2
+llm_max_queue = 16
+llm_queue_timeout = 20.0
+
+# Clients shared by every Streamlit session in this process. Streamlit reruns
+# app.py on each interaction but imports this module once, so whatever is
+# cached here stays warm across reruns and sessions.
+_lock = threading.Lock()
+_embeddings = None
+_query_cache = None
+_answer_cache = None
+_llms = {}
+_vectorstores = {}
+_keyword_indexes = {}
+_generations = {}
+_loop = None
+_search_pool = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="search")
+
+# Identical questions asked at the same time share one retrieval and one
+# generation (see app.handle_userinput_async)
+question_flights = SingleFlight()
+llm_scheduler = LLMScheduler(llm_max_concurrent, llm_max_queue, llm_queue_timeout)
+
+
+def get_query_embeddings():
+    global _embeddings, _query_cache
+    with _lock:
+        if _embeddings is None:
+            disk_cache = EmbeddingCache(embedding_cache_path)
+            _query_cache = QueryEmbeddingCache(model_embedding, max_entries=query_cache_size,
+                                               disk_cache=disk_cache if query_cache_persist else None)
+            _embeddings = CachedEmbeddings(OllamaEmbeddings(model=model_embedding), disk_cache,
+                                           model_embedding, query_cache=_query_cache)
+        return _embeddings
+
+
+def query_cache_stats():
+    return _query_cache.stats() if _query_cache is not None else {}
+
+
+def get_answer_cache():
+    global _answer_cache
+    with _lock:
+        if _answer_cache is None:
+            settings = dict(threshold=answer_cache_threshold, ttl_seconds=answer_cache_ttl_seconds,
+                            max_entries=answer_cache_max_entries)
+            backend = answer_cache_backend
+            if backend == "redis":
+                try:
+                    _answer_cache = make_answer_cache("redis", redis_client=redis_client(), **settings)
+                except redis.exceptions.ConnectionError as e:
+                    print(f"Redis unavailable ({e}), using the embedded answer cache instead.")
+                    backend = "sqlite"
+            if _answer_cache is None:
+                _answer_cache = make_answer_cache(backend, path=answer_cache_path, **settings)
+        return _answer_cache
+
+
+def get_shared_llm(temperature=0.1, priority=INTERACTIVE):
+    """Shared LLM client whose generations wait for an llm_scheduler slot;
+    raises AdmissionRejected when the LLM is overloaded."""
+    with _lock:
+        if temperature not in _llms:
+            _llms[temperature] = get_llm(temperature)
+        return ScheduledLLM(_llms[temperature], llm_scheduler, priority)
+
+
+def index_stamp(collection_name):
+    """Changes whenever ingestion commits a PDF to the collection."""
+    try:
+        return os.stat(manifest_path(os.path.join(os.curdir, output_folder), collection_name)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def collection_generation(collection_name):
+    """(generation, content_generations) of the collection's ingestion manifest,
+    re-read only when the manifest file changed."""
+    stamp = index_stamp(collection_name)
+    with _lock:
+        cached = _generations.get(collection_name)
+        if cached and cached[0] == stamp:
+            return cached[1], cached[2]
+    manifest = IngestManifest(manifest_path(os.path.join(os.curdir, output_folder), collection_name))
+    with _lock:
+        _generations[collection_name] = (stamp, manifest.generation, manifest.content_generations)
+    return manifest.generation, manifest.content_generations
+
+
+def answer_scope(collection_names):
+    """Answer cache scope of a question searched over `collection_names`."""
+    return "+".join(sorted(collection_names))
+
+
+def scope_generation(collection_names):
+    """collection_generation() for a set of collections searched together.
+
+    The generation is the sum of theirs. A content key's generation is its
+    own plus the current generations of the other collections, which can only
+    overstate how recently it changed: answers are sometimes dropped early,
+    never kept stale.
+    """
+    generations = {name: collection_generation(name) for name in collection_names}
+    total = sum(generation for generation, _ in generations.values())
+    merged = {}
+    for generation, content_generations in generations.values():
+        others = total - generation
+        for key, changed in content_generations.items():
+            merged[key] = max(merged.get(key, 0), changed + others)
+    return total, merged
+
+
+def sync_answer_cache(collection_names):
+    """Drop cached answers made stale by ingestion since the last call and
+    return the generation to record with answers cached from now on."""
+    scope = answer_scope(collection_names)
+    generation, content_generations = scope_generation(collection_names)
+    dropped = get_answer_cache().invalidate(scope, generation, content_generations)
+    if dropped:
+        print(f"Dropped {dropped} cached answers of {scope} after re-ingestion")
+    return generation
+
+
+def get_collection(collection_name):
+    """Warm vectorstore for `collection_name`.
+
+    Ingestion runs in other processes (embedder.py, watcher.py) and saves
+    the collection's manifest after every PDF it commits or removes, so the
+    manifest's mtime (index_stamp) is what tells this process to reopen it,
+    as does a switch to the NumPy store once ingestion has imported it.
+    """
+    stamp = (index_stamp(collection_name), vector_backend(collection_name, persist_directory))
+    with _lock:
+        cached = _vectorstores.get(collection_name)
+        if cached and cached[0] == stamp:
+            return cached[1]
+    embeddings = get_query_embeddings()
+    vectorstore = get_vectorstore(collection_name=collection_name, embedding_function=embeddings,
+                                  persist_directory=persist_directory)
+    with _lock:
+        _vectorstores[collection_name] = (stamp, vectorstore)
+    return vectorstore
+
+
+def get_keyword_index(collection_name):
+    """The collection's BM25 index, or None when it has none (or hybrid
+    retrieval is off)."""
+    path = keyword_index_path(os.path.join(os.curdir, output_folder), collection_name)
+    if not hybrid_retrieval or not os.path.exists(path):
+        return None
+    with _lock:
+        if collection_name not in _keyword_indexes:
+            _keyword_indexes[collection_name] = KeywordIndex(path)
+        return _keyword_indexes[collection_name]
+
+
+def get_retriever(collection_names, k=4):
+    """Retriever searching all of `collection_names` in parallel with one
+    query embedding, fusing BM25 where a collection has a keyword index."""
+    collections = [(name, get_collection(name), get_keyword_index(name)) for name in collection_names]
+    return FederatedRetriever(collections=collections, embeddings=get_query_embeddings(),
+                              pool=_search_pool, k=k)
+
+
+def get_event_loop():
+    """The process-wide event loop, running in a daemon thread.
+
+    Ollama's async clients keep an httpx connection pool bound to the loop
+    that first used it, so every session runs its coroutines here and the
+    shared LLM and embedding clients keep one pool for all users.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-pipeline", daemon=True).start()
+        return _loop
+
+
+def iter_async(agen):
+    """Drive the async generator `agen` on the shared loop and yield its items
+    in the calling thread (Streamlit only renders from the script thread)."""
+    items = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put(("item", item))
+        except Exception as e:
+            items.put(("error", e))
+        finally:
+            items.put(("done", None))
+
+    asyncio.run_coroutine_threadsafe(pump(), get_event_loop())
+    while True:
+        kind, value = items.get()
+        if kind == "done":
+            return
+        if kind == "error":
+            raise value
+        yield value
@@ -0,0 +1,91 @@
+import asyncio
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.retrievers import BaseRetriever
+
+
+def scored_search(vectorstore, query_vector, k):
+    """[(doc, relevance)] for `query_vector`, relevance in [0, 1], best first."""
+    relevance = vectorstore._select_relevance_score_fn()
+    hits = vectorstore.similarity_search_by_vector_with_relevance_scores(query_vector, k=k)
+    return [(doc, relevance(distance)) for doc, distance in hits]
+
+
+class FederatedRetriever(BaseRetriever):
+    """Searches several collections at once and merges them into one top-k.
+
+    The query is embedded once and every collection's vector search (plus
+    its BM25 search, when it has a keyword index) runs concurrently on
+    `pool`, so searching all of a user's collections costs about one
+    search. Similarity scores share one embedding space, so the vector hits
+    of all collections form a single ranking; BM25 scores depend on each
+    collection's statistics, so each keyword ranking is fused as its own
+    list. Fusion is reciprocal rank: sum(1 / (rrf_k + rank)).
+
+    Returned documents carry "collection" and "score" (the vector
+    relevance, None for keyword-only hits) in their metadata. Callers that
+    already embedded the query pass it as `query_vector`.
+    """
+
+    collections: list          # [(name, vectorstore, keyword_index or None)]
+    embeddings: object
+    pool: object = None
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query, *, run_manager=None, k=None, query_vector=None):
+        k = k or self.k
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(query)
+        pool = self.pool or ThreadPoolExecutor(max_workers=max(1, len(self.collections)))
+        try:
+            results = list(pool.map(lambda item: self._search_one(item, query, query_vector), self.collections))
+        finally:
+            if pool is not self.pool:
+                pool.shutdown(wait=False)
+
+        fused, docs, scores = {}, {}, {}
+        vector_hits = sorted((hit for hits, _ in results for hit in hits), key=lambda hit: hit[2], reverse=True)
+        for rank, (key, doc, score) in enumerate(vector_hits):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+            docs[key] = doc
+            scores[key] = score
+        for _, keyword_hits in results:
+            for rank, key in enumerate(keyword_hits):
+                fused[key] = fused.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        best = [key for key, _ in heapq.nlargest(k, fused.items(), key=lambda item: item[1])]
+        self._fetch_missing(best, docs)
+        ranked = []
+        for key in best:
+            if key in docs:
+                doc = docs[key]
+                doc.metadata["collection"] = key[0]
+                doc.metadata["score"] = scores.get(key)
+                ranked.append(doc)
+        return ranked
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None, k=None, query_vector=None):
+        # the searches are blocking SQLite/Chroma calls; run them off the loop
+        return await asyncio.to_thread(self._get_relevant_documents, query, k=k, query_vector=query_vector)
+
+    def _search_one(self, item, query, query_vector):
+        name, vectorstore, keyword_index = item
+        hits = [((name, doc.id), doc, score) for doc, score in scored_search(vectorstore, query_vector, self.fetch_k)]
+        keyword_hits = []
+        if keyword_index is not None:
+            keyword_hits = [(name, chunk_id) for chunk_id, _ in keyword_index.search(query, self.fetch_k)]
+        return hits, keyword_hits
+
+    def _fetch_missing(self, keys, docs):
+        # keyword-only hits: read their text from the collection they came from
+        stores = {name: vectorstore for name, vectorstore, _ in self.collections}
+        missing = {}
+        for name, chunk_id in keys:
+            if (name, chunk_id) not in docs:
+                missing.setdefault(name, []).append(chunk_id)
+        for name, chunk_ids in missing.items():
+            for doc in stores[name].get_by_ids(chunk_ids):
+                docs[(name, doc.id)] = doc
@@ -0,0 +1,75 @@
+import threading
+
+
+class _Flight:
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """Coalesces concurrent identical requests into one.
+
+    The first stream() for a key starts the producer in a background thread;
+    every caller with the same key while it runs, the first one included,
+    replays the items produced so far and then follows along live. Running
+    the producer outside the callers' threads means a session that goes
+    away (a Streamlit rerun) does not stall the others. Once the producer
+    finishes, the key is free again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def stream(self, key, make_source):
+        """Iterate the items of `make_source()` (an iterator), shared with any
+        concurrent caller using the same `key`."""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = _Flight()
+                self.started += 1
+                threading.Thread(target=self._run, args=(key, flight, make_source),
+                                 name="single-flight", daemon=True).start()
+            else:
+                self.coalesced += 1
+        return self._follow(flight)
+
+    def _run(self, key, flight, make_source):
+        try:
+            for item in make_source():
+                with flight.cond:
+                    flight.items.append(item)
+                    flight.cond.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self.lock:
+                self.flights.pop(key, None)
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _follow(self, flight):
+        position = 0
+        while True:
+            with flight.cond:
+                while position == len(flight.items) and not flight.done:
+                    flight.cond.wait()
+                items = flight.items[position:]
+                done = flight.done
+            position += len(items)
+            yield from items
+            if done and position == len(flight.items):
+                if flight.error is not None:
+                    raise flight.error
+                return
+
+    def stats(self):
+        with self.lock:
+            return {"started": self.started, "coalesced": self.coalesced, "in_flight": len(self.flights)}
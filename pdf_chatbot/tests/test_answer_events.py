@@ -0,0 +1,90 @@
+import asyncio
+import importlib
+import os
+import sys
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(APP_DIR)
+
+
+class StubEmbeddings(Embeddings):
+    """Embeds by counting a few keywords; counts its query calls."""
+
+    words = ("leave", "sick", "laptop", "password")
+
+    def __init__(self):
+        self.query_calls = 0
+
+    def _embed(self, text):
+        text = text.lower()
+        return [float(text.count(word)) + 0.01 for word in self.words]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        return self._embed(text)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+class StubLLM:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.prompts = []
+
+    async def astream(self, prompt):
+        self.prompts.append(prompt)
+        for chunk in self.chunks:
+            yield chunk
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # Templates load the bot avatar relative to the app folder
+    monkeypatch.chdir(APP_DIR)
+    return importlib.import_module("app")
+
+
+def collect(agen):
+    async def run():
+        return [item async for item in agen]
+    return asyncio.run(run())
+
+
+def test_answer_events_embeds_once_and_caches_the_answer(app, monkeypatch, tmp_path):
+    from answer_cache import MemoryAnswerCache
+    from numpy_store import NumpyVectorStore
+    from retrievers import FederatedRetriever
+
+    embeddings = StubEmbeddings()
+    store = NumpyVectorStore("default", embeddings, str(tmp_path))
+    store.add_texts(["Employees get 12 sick leave days per year.", "Laptop passwords expire every 90 days."],
+                    metadatas=[{"source": "leave.pdf", "page": 1}, {"source": "it.pdf", "page": 3}],
+                    ids=["aaaa_0", "bbbb_0"])
+    retriever = FederatedRetriever(collections=[("default", store, None)], embeddings=embeddings, k=2)
+    answer_cache = MemoryAnswerCache()
+    llm = StubLLM(["You get ", "12 sick leave days."])
+    monkeypatch.setattr(app, "get_query_embeddings", lambda: embeddings)
+    monkeypatch.setattr(app, "get_answer_cache", lambda: answer_cache)
+    monkeypatch.setattr(app, "sync_answer_cache", lambda names: 0)
+    monkeypatch.setattr(app, "get_shared_llm", lambda: llm)
+
+    events = collect(app.answer_events("How many sick leave days?", [retriever], ["default"]))
+
+    docs, chunks = events[0], events[1:]
+    assert docs[0].id == "aaaa_0" and docs[0].metadata["collection"] == "default"
+    assert "".join(chunks) == "You get 12 sick leave days."
+    assert "Employees get 12 sick leave days" in llm.prompts[0]
+    # one embedding served both the cache lookup and retrieval
+    assert embeddings.query_calls == 1
+
+    events = collect(app.answer_events("how many sick leave days?", [retriever], ["default"]))
+    assert events[1] == "You get 12 sick leave days."
+    assert len(llm.prompts) == 1
+    assert events[0][0].metadata["chunk_id"] == "aaaa_0"
@@ -1,21 +1,110 @@
 from langchain_chroma import Chroma
+import chromadb
+import os
 import redis
 import numpy as np
 import json
+import threading
+import glob
+from numpy_store import NumpyVectorStore
 
 # pdf_file_path = '/Users/tufailahmed/Desktop/PDFs/Team_A'
 # pdf_file_path = '/Users/tufailahmed/Desktop/PDFs/Team_B'
 pdf_file_path = '/Users/tufailahmed/Desktop/PDFs/Default'
 
+# Folder watched for each collection by watcher.py
+collection_folders = {
+    'default': '/Users/tufailahmed/Desktop/PDFs/Default',
+    'team_a': '/Users/tufailahmed/Desktop/PDFs/Team_A',
+    'team_b': '/Users/tufailahmed/Desktop/PDFs/Team_B',
+}
 
 
-def get_vectorstore(collection_name,embedding_function,persist_directory):
-    vectorstore = Chroma(
-    collection_name=collection_name,
-    embedding_function=embedding_function,
-    persist_directory=persist_directory,)
+
+# Vector store behind each collection: "chroma", or "numpy" for an exact
+# memory-mapped matrix (numpy_store.py). With exact recall it beats Chroma
+# up to ~10k chunks, and by far on filtered queries; around 100k chunks
+# Chroma's HNSW is faster (benchmarks/bench_vector_store.py).
+# A collection switched to "numpy" is copied over from Chroma, embeddings
+# included, the next time ingestion opens it; until then the app keeps
+# searching Chroma.
+default_vector_backend = 'chroma'
+vector_backends = {
+    # 'team_a': 'numpy',
+}
+
+# chromadb's shared client cache is not safe to initialise from several
+# threads at once, so collections are opened one at a time.
+_open_lock = threading.Lock()
+
+
+def vector_backend(collection_name,persist_directory,backend=None):
+    """The backend get_vectorstore opens for readers: Chroma until a
+    collection switched to "numpy" has been imported."""
+    backend = backend or vector_backends.get(collection_name, default_vector_backend)
+    if backend == 'numpy' and not os.path.exists(NumpyVectorStore.store_path(persist_directory, collection_name)):
+        return 'chroma'
+    return backend
+
+
+def get_vectorstore(collection_name,embedding_function,persist_directory,backend=None,allow_import=False):
+    # allow_import is for ingestion, the one process writing a collection
+    backend = backend or vector_backends.get(collection_name, default_vector_backend)
+    if vector_backend(collection_name, persist_directory, backend) != backend:
+        if allow_import:
+            import_from_chroma(collection_name, persist_directory)
+        else:
+            backend = 'chroma'
+    if backend == 'numpy':
+        return NumpyVectorStore(collection_name, embedding_function, persist_directory)
+    with _open_lock:
+        vectorstore = Chroma(
+        collection_name=collection_name,
+        embedding_function=embedding_function,
+        persist_directory=persist_directory,)
     return vectorstore
 
+
+def set_source(vectorstore, ids, source):
+    """Point the "source" metadata of the chunks `ids` at another PDF name,
+    without embedding them again."""
+    if isinstance(vectorstore, NumpyVectorStore):
+        vectorstore.update_metadata(ids, {'source': source})
+        return
+    for i in range(0, len(ids), 5000):
+        part = list(ids[i:i + 5000])
+        # Chroma merges the given keys into the stored metadata
+        vectorstore._collection.update(ids=part, metadatas=[{'source': source}] * len(part))
+
+
+def import_from_chroma(collection_name, persist_directory, batch_size=5000):
+    """Build the NumPy store of a collection from its Chroma collection,
+    embeddings included. It is written under a staging name and renamed
+    once complete, so the app never opens a half-imported store."""
+    if not os.path.exists(os.path.join(persist_directory, 'chroma.sqlite3')):
+        return
+    with _open_lock:
+        client = chromadb.PersistentClient(path=persist_directory)
+        if collection_name not in [c.name for c in client.list_collections()]:
+            return
+        collection = client.get_collection(collection_name)
+    staging_name = f'{collection_name}.importing'
+    staging_path = NumpyVectorStore.store_path(persist_directory, staging_name)
+    # left by an interrupted import
+    leftovers = [staging_path + suffix for suffix in ('', '-wal', '-shm')]
+    leftovers += glob.glob(os.path.join(os.path.dirname(staging_path), f'{glob.escape(staging_name)}-*.f32'))
+    for path in leftovers:
+        if os.path.exists(path):
+            os.remove(path)
+    staging = NumpyVectorStore(staging_name, None, persist_directory)
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        found = collection.get(include=['embeddings', 'documents', 'metadatas'], limit=batch_size, offset=offset)
+        staging.add_vectors(found['ids'], found['embeddings'], found['documents'], found['metadatas'])
+    staging.close()
+    os.replace(staging_path, NumpyVectorStore.store_path(persist_directory, collection_name))
+    print(f"Copied {total} chunks of {collection_name} from Chroma")
+
 def redis_client():
     # Connect to Redis (adjust host/port if needed)
     redis_client = redis.Redis(host='localhost', port=6379, db=0)
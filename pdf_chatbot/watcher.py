@@ -0,0 +1,139 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+from embedder import output_folder, parse_workers, embed_workers, embed_batch_size, embed_max_in_flight
+from ingest_manifest import IngestCheckpoint, IngestManifest, checkpoint_path, manifest_path
+from pdf_utils import IngestPools, IngestStats, get_pdf_text_emd, get_ingest_embeddings, remove_pdfs
+from vectordb import collection_folders
+
+# Seconds without new events on a collection before its changes are ingested.
+# Copying a large PDF fires many modified events; this waits for the last one.
+debounce_seconds = 3.0
+
+
+class CollectionEventHandler(FileSystemEventHandler):
+    """Collects PDF events for one collection folder until they go quiet."""
+
+    def __init__(self, collection_name, folder):
+        self.collection_name = collection_name
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.changed = set()
+        self.deleted = set()
+        self.last_event = 0.0
+
+    def _touch(self, changed=None, deleted=None):
+        with self.lock:
+            if changed and changed.endswith(".pdf"):
+                self.changed.add(changed)
+                self.deleted.discard(changed)
+            if deleted and deleted.endswith(".pdf"):
+                self.deleted.add(deleted)
+                self.changed.discard(deleted)
+            self.last_event = time.monotonic()
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._touch(changed=event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self._touch(changed=event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self._touch(deleted=event.src_path)
+            if os.path.dirname(event.dest_path) == os.path.abspath(self.folder):
+                self._touch(changed=event.dest_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self._touch(deleted=event.src_path)
+
+    def take_settled(self):
+        """Return (changed, deleted) once no event arrived for `debounce_seconds`."""
+        with self.lock:
+            if not (self.changed or self.deleted) or time.monotonic() - self.last_event < debounce_seconds:
+                return None
+            changed, deleted = sorted(self.changed), sorted(self.deleted)
+            self.changed, self.deleted = set(), set()
+            return changed, deleted
+
+
+def sync_collection(collection_name, changed, deleted, embeddings, pools, stats):
+    # Ingest before removing: a renamed PDF is then recognised by its hash as
+    # an alias of the old name and keeps its chunks instead of being re-added.
+    changed = [path for path in changed if os.path.isfile(path)]
+    if changed:
+        get_pdf_text_emd(changed, output_folder=output_folder, collection_name=collection_name,
+                         parse_workers=parse_workers, embed_workers=embed_workers,
+                         batch_size=embed_batch_size, max_in_flight=embed_max_in_flight,
+                         embeddings=embeddings, pools=pools, stats=stats)
+    if deleted:
+        remove_pdfs(deleted, collection_name=collection_name, output_folder=output_folder)
+
+
+def catch_up(collection_name, folder, embeddings, pools, stats):
+    """Apply what changed while the watcher was not running.
+
+    Costs a stat() per PDF: unchanged files are skipped by the manifest and
+    only files listed in it (or with uncommitted batches in the checkpoint)
+    that no longer exist are removed.
+    """
+    output_folder_path = os.path.join(os.path.abspath(os.curdir), output_folder)
+    known = set(IngestManifest(manifest_path(output_folder_path, collection_name)).sources())
+    known.update(IngestCheckpoint(checkpoint_path(output_folder_path, collection_name)).sources())
+    present = {f for f in os.listdir(folder) if f.endswith(".pdf")}
+    missing = sorted(name for name in known if name not in present)
+    sync_collection(collection_name, [os.path.join(folder, f) for f in sorted(present)], missing, embeddings,
+                    pools, stats)
+
+
+def watch(folders=None, poll_interval=0.5):
+    folders = folders or collection_folders
+    embeddings = get_ingest_embeddings()  # one warm client for every collection
+    # Started once: spawning parse processes per event would cost more than
+    # parsing the PDF that changed
+    pools = IngestPools(parse_workers, embed_workers, embed_max_in_flight)
+    stats = IngestStats("watcher")
+    observer = Observer()
+    handlers = []
+    for collection_name, folder in folders.items():
+        if not os.path.isdir(folder):
+            print(f"Skipping {collection_name}: {folder} does not exist")
+            continue
+        catch_up(collection_name, folder, embeddings, pools, stats)
+        handler = CollectionEventHandler(collection_name, folder)
+        observer.schedule(handler, folder, recursive=False)
+        handlers.append(handler)
+        print(f"Watching {folder} -> {collection_name}")
+
+    observer.start()
+    try:
+        while True:
+            for handler in handlers:
+                settled = handler.take_settled()
+                if settled:
+                    try:
+                        sync_collection(handler.collection_name, *settled, embeddings, pools, stats)
+                    except Exception as e:
+                        print(f"Error syncing {handler.collection_name}: {e}")
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+        pools.close()
+        stats.report()
+
+
+if __name__ == '__main__':
+    watch()